@@ -3,6 +3,14 @@ from django.contrib.auth import get_user_model
 
 from rest_framework import serializers
 
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from core.revocation import is_revoked
+
 
 class UserSerializers(serializers.ModelSerializer):
     class Meta:
@@ -24,6 +32,40 @@ class UserSerializers(serializers.ModelSerializer):
         return user
 
 
+class LogoutSerializer(serializers.Serializer):
+    refresh = serializers.CharField()
+
+    def validate_refresh(self, value):
+        try:
+            refresh = RefreshToken(value)
+        except TokenError as error:
+            raise serializers.ValidationError(str(error))
+        user = self.context['request'].user
+        if str(refresh.get(api_settings.USER_ID_CLAIM)) != str(user.pk):
+            raise serializers.ValidationError(
+                "Refresh token belongs to another user.")
+        return refresh
+
+
+class RevocableTokenRefreshSerializer(TokenRefreshSerializer):
+    """Refuses revoked refresh tokens and those of a changed password."""
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        if is_revoked(refresh):
+            raise TokenError("Token is revoked")
+        if api_settings.CHECK_REVOKE_TOKEN:
+            user = get_user_model().objects.filter(**{
+                api_settings.USER_ID_FIELD:
+                refresh.get(api_settings.USER_ID_CLAIM)
+            }).only('password').first()
+            if user is None or refresh.get(
+                    api_settings.REVOKE_TOKEN_CLAIM) != \
+                    get_md5_hash_password(user.password):
+                raise TokenError("Token is revoked")
+        return super().validate(attrs)
+
+
 # class AuthTokenSerializers(serializers.Serializer):
 #     username = serializers.CharField()
 #     password = serializers.CharField(
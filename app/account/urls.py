@@ -1,9 +1,6 @@
 from django.urls import path
 
-from rest_framework_simplejwt.views import (
-    TokenObtainPairView,
-    TokenRefreshView
-)
+from rest_framework_simplejwt.views import TokenObtainPairView
 
 from account import views
 
@@ -13,7 +10,9 @@ app_name = "account"
 urlpatterns = [
     path('create/', views.CreateUserView.as_view(), name='create-user'),
     path('token/', TokenObtainPairView.as_view(), name='access-token'),
-    path('token/refresh', TokenRefreshView.as_view(), name='refresh-token'),
+    path('token/refresh', views.RefreshTokenView.as_view(),
+         name='refresh-token'),
+    path('logout/', views.LogoutView.as_view(), name='logout'),
     path('<str:username>/', views.UpdateAndRetrieveView.as_view(),
          name='detail')
 ]
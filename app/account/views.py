@@ -1,10 +1,19 @@
 from django.contrib.auth import get_user_model
 
-from rest_framework import generics, permissions
+from rest_framework import generics, permissions, status
+from rest_framework.response import Response
+from rest_framework.views import APIView
 
-from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.views import TokenRefreshView
 
-from account.serializers import UserSerializers
+from core.authentication import JWTAuthentication
+from core.revocation import revoke
+
+from account.serializers import (
+    LogoutSerializer,
+    RevocableTokenRefreshSerializer,
+    UserSerializers
+)
 from account.permissions import IsOwnerOrReadOnly
 
 
@@ -18,3 +27,26 @@ class UpdateAndRetrieveView(generics.RetrieveUpdateAPIView):
     authentication_classes = (JWTAuthentication, )
     permission_classes = (permissions.IsAuthenticated, IsOwnerOrReadOnly)
     lookup_field = "username"
+
+
+class LogoutView(APIView):
+    """Revoke the access token of the request and its refresh token.
+
+    The refresh token is required, it could otherwise mint new access
+    tokens until it expires.
+    """
+    serializer_class = LogoutSerializer
+    authentication_classes = (JWTAuthentication, )
+    permission_classes = (permissions.IsAuthenticated, )
+
+    def post(self, request):
+        serializer = self.serializer_class(data=request.data,
+                                           context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        revoke(request.auth)
+        revoke(serializer.validated_data['refresh'])
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class RefreshTokenView(TokenRefreshView):
+    serializer_class = RevocableTokenRefreshSerializer
@@ -58,6 +58,55 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Set SERVER_TIMING=1 to report the query count and the database,
+# permission, serialization and render time of every request in a
+# Server-Timing header and on the core.timing logger.
+if os.environ.get('SERVER_TIMING') == '1':
+    MIDDLEWARE.insert(0, 'core.middleware.ServerTimingMiddleware')
+
+# A PROFILING_SAMPLE_RATE share of the requests, and requests carrying an
+# X-Profile header from the profile_token command, are profiled into
+# PROFILING_DIR (see the profile_report command).
+MIDDLEWARE.insert(0, 'core.middleware.ProfilingMiddleware')
+PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', 0))
+PROFILING_DIR = os.environ.get('PROFILING_DIR', '/tmp/secretsanta-profiles')
+PROFILING_MAX_DUMPS = 50
+
+# Request metrics are served at /metrics. With several worker processes set
+# METRICS_DIR to a directory they share, emptied on every start, so the
+# numbers of all workers are added up. Only clients from METRICS_ALLOWED_IPS
+# or sending "Authorization: Bearer <METRICS_TOKEN>" may read them; behind a
+# reverse proxy every client has the address of the proxy, so set a token.
+MIDDLEWARE.insert(0, 'core.middleware.MetricsMiddleware')
+METRICS_DIR = os.environ.get('METRICS_DIR')
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+# Users of JWT authenticated requests are cached this many seconds. Saving
+# a user drops it from the cache, with the local memory cache only in the
+# process which saved it; the others see the change after this timeout.
+# With JWT_CLAIMS_ONLY_READS safe requests are not checked against the
+# database at all, a deactivated user can then read until its access token
+# expires.
+USER_CACHE_TIMEOUT = 60
+JWT_CLAIMS_ONLY_READS = False
+
+# Tokens revoked on logout are kept in a Bloom filter by every process,
+# which reads the revocations of the other processes every
+# JWT_REVOCATION_SYNC_INTERVAL seconds; until then they may still accept a
+# revoked token. The filter is rebuilt every JWT_REVOCATION_REBUILD_INTERVAL
+# seconds and sized for JWT_REVOCATION_CAPACITY unexpired revocations.
+JWT_REVOCATION_SYNC_INTERVAL = 5
+JWT_REVOCATION_REBUILD_INTERVAL = 60 * 60
+JWT_REVOCATION_CAPACITY = 100000
+
+# Tokens carry a hash of the password, changing it invalidates them. The
+# other processes compare it with their cached user, so with the local
+# memory cache they accept the old tokens for up to USER_CACHE_TIMEOUT.
+SIMPLE_JWT = {
+    'CHECK_REVOKE_TOKEN': True,
+}
+
 ROOT_URLCONF = 'app.urls'
 
 TEMPLATES = [
@@ -93,6 +142,20 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.1/topics/cache/
+# The local memory cache is private to every process. With several worker
+# processes use a shared backend (Memcached, Redis), otherwise changes to
+# cached users reach the other processes only after USER_CACHE_TIMEOUT.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'secretsanta',
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
 
@@ -141,10 +204,48 @@ AUTH_USER_MODEL = 'core.User'
 
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    'DEFAULT_RENDERER_CLASSES': [
+        'core.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
 }
 
 SPECTACULAR_SETTINGS = {
     'TITLE': 'Django SecretSanta',
     'DESCRIPTION': 'A fun project for giving gifts',
     'VERSION': '0.0.9-alpha',
-}
\ No newline at end of file
+}
+
+# Secret Santa
+
+SECRETSANTA_MATCHER = 'secretsanta.matching.ExclusionMatcher'
+
+# Decoded pairings of compact events are cached per process, up to this
+# many bytes in total.
+SECRETSANTA_PAIRING_CACHE_BYTES = 32 * 1024 * 1024
+
+# Grouped events with at least SECRETSANTA_PARALLEL_THRESHOLD attenders are
+# matched in a pool of SECRETSANTA_MATCH_WORKERS processes (default: one per
+# CPU).
+SECRETSANTA_PARALLEL_THRESHOLD = 50000
+SECRETSANTA_MATCH_WORKERS = None
+
+# Event starts run in a thread pool of this many workers inside the web
+# process, set SECRETSANTA_START_ASYNC to False to start events inline.
+SECRETSANTA_START_ASYNC = True
+SECRETSANTA_START_WORKERS = 2
+# Running start jobs touch their row every SECRETSANTA_START_HEARTBEAT
+# seconds, copying their progress into it. Active jobs not updated for
+# SECRETSANTA_START_JOB_TIMEOUT seconds were lost with their process and
+# are failed, so the event can be started again. The progress is published
+# at once through the cache too, for processes sharing it.
+SECRETSANTA_START_HEARTBEAT = 30
+SECRETSANTA_START_JOB_TIMEOUT = 10 * 60
+
+# GET requests on events and gifts are answered from database rows, skipping
+# the serializers, which produce the same output.
+SECRETSANTA_FAST_SERIALIZERS = True
+
+# Event details with more attenders than this stream the attender ids
+# instead of rendering the whole response in memory.
+SECRETSANTA_STREAM_ATTENDERS = 10000
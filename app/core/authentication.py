@@ -0,0 +1,93 @@
+"""JWT authentication with a short lived cache of the token users.
+
+Loading the user of a token costs a query on every request. Users are
+cached for USER_CACHE_TIMEOUT seconds instead, and dropped from the cache
+whenever they are saved or deleted (see core.signals). Writes through
+QuerySet.update() send no signal and have to call invalidate_user
+themselves.
+
+Dropping a user only reaches the processes sharing the cache. With the
+process local default cache the other processes keep the cached user,
+deactivated or not, for up to USER_CACHE_TIMEOUT seconds; configure a
+shared cache (Memcached, Redis) for changes to take effect at once.
+
+With JWT_CLAIMS_ONLY_READS enabled, safe requests do not load the user at
+all and get a TokenUser built from the token claims. Views reached by safe
+requests must then only rely on request.user.pk.
+
+Tokens revoked through core.revocation, on logout, are refused. Tokens
+issued before a password change are refused by comparing their password
+hash with the cached user, so the same USER_CACHE_TIMEOUT bound applies.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.permissions import SAFE_METHODS
+
+from rest_framework_simplejwt import authentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from core.metrics import JWT_AUTHENTICATIONS
+from core.revocation import is_revoked
+
+
+USER_CACHE_TIMEOUT = 60
+
+
+def user_cache_key(user_id) -> str:
+    return f"core:user:{user_id}"
+
+
+def invalidate_user(user_id):
+    cache.delete(user_cache_key(user_id))
+
+
+class JWTAuthentication(authentication.JWTAuthentication):
+    """simplejwt authentication with cached users, counting its outcomes."""
+
+    claims_only = False
+
+    def authenticate(self, request):
+        self.claims_only = request.method in SAFE_METHODS and \
+            getattr(settings, 'JWT_CLAIMS_ONLY_READS', False)
+        try:
+            result = super().authenticate(request)
+        except InvalidToken:
+            JWT_AUTHENTICATIONS.inc(outcome='invalid_token')
+            raise
+        except AuthenticationFailed:
+            JWT_AUTHENTICATIONS.inc(outcome='rejected_user')
+            raise
+        JWT_AUTHENTICATIONS.inc(
+            outcome='anonymous' if result is None else 'success')
+        return result
+
+    def get_validated_token(self, raw_token):
+        validated_token = super().get_validated_token(raw_token)
+        if is_revoked(validated_token):
+            raise InvalidToken("Token is revoked")
+        return validated_token
+
+    def get_user(self, validated_token):
+        if api_settings.USER_ID_CLAIM not in validated_token:
+            raise InvalidToken(
+                "Token contained no recognizable user identification")
+        if self.claims_only:
+            return api_settings.TOKEN_USER_CLASS(validated_token)
+
+        key = user_cache_key(validated_token[api_settings.USER_ID_CLAIM])
+        user = cache.get(key)
+        if user is None:
+            user = super().get_user(validated_token)
+            cache.set(key, user, getattr(settings, 'USER_CACHE_TIMEOUT',
+                                         USER_CACHE_TIMEOUT))
+        elif api_settings.CHECK_REVOKE_TOKEN and \
+                validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != \
+                get_md5_hash_password(user.password):
+            raise AuthenticationFailed(
+                "The user's password has been changed.",
+                code="password_changed")
+        return user
@@ -0,0 +1,31 @@
+import pstats
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.profiling import list_dumps, profile_dir
+
+
+class Command(BaseCommand):
+    """Django command to sum up the dumps of the profiling middleware"""
+
+    help = "Show the top functions across the stored request profiles."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--action',
+                            help="Only the dumps of this view action, "
+                                 "e.g. EventViewSet.retrieve.")
+        parser.add_argument('--sort', default='cumulative',
+                            help="pstats sort key.")
+        parser.add_argument('--limit', type=int, default=30,
+                            help="Number of functions to show.")
+
+    def handle(self, *args, **options):
+        dumps = list_dumps(options['action'])
+        if not dumps:
+            raise CommandError(f"No profiles found in {profile_dir()}")
+
+        actions = sorted({dump.parent.name for dump in dumps})
+        self.stdout.write(f"{len(dumps)} profiles of {', '.join(actions)}")
+        stats = pstats.Stats(*map(str, dumps), stream=self.stdout)
+        stats.strip_dirs().sort_stats(options['sort'])\
+             .print_stats(options['limit'])
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from core.profiling import TOKEN_MAX_AGE, make_token
+
+
+class Command(BaseCommand):
+    """Django command to print a token for profiling chosen requests"""
+
+    help = "Print a value for the X-Profile header."
+
+    def handle(self, *args, **options):
+        self.stdout.write(make_token())
+        self.stderr.write(
+            f"Valid for {TOKEN_MAX_AGE // 60} minutes, send it as "
+            f"the X-Profile header.")
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.models import RevokedToken
+
+
+class Command(BaseCommand):
+    """Django command to delete revocations of expired tokens"""
+
+    help = "Delete the revoked tokens which have expired anyway."
+
+    def handle(self, *args, **options):
+        deleted, _ = RevokedToken.objects.filter(
+            expires_at__lte=timezone.now()).delete()
+        self.stdout.write(f"Deleted {deleted} expired revoked tokens.")
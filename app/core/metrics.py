@@ -0,0 +1,258 @@
+"""Prometheus metrics kept by the application itself.
+
+Counters and histograms add their samples to a per process store. Without
+METRICS_DIR the store is a dict in memory, so /metrics only shows the
+process which answers it. With METRICS_DIR set, every process writes its
+samples to its own memory mapped file in that directory and /metrics sums
+all the files up, which covers every worker of the server; empty the
+directory when the server (re)starts.
+
+Each process is the only writer of its store, so updates only take an
+uncontended per process lock.
+"""
+import json
+import mmap
+import os
+import struct
+from bisect import bisect_left
+from pathlib import Path
+from threading import Lock
+
+from django.conf import settings
+
+
+DEFAULT_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+
+_registry = {}
+
+
+class MemoryStore:
+
+    def __init__(self):
+        self.lock = Lock()
+        self.values = {}
+
+    def inc(self, key: str, amount: float):
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def collect(self) -> dict:
+        with self.lock:
+            return dict(self.values)
+
+
+class MmapStore:
+    """Samples of one process in a memory mapped file.
+
+    The file starts with the number of bytes in use, followed by entries
+    of a key length, the utf-8 key padded to 8 bytes and a double value.
+    """
+
+    INITIAL_SIZE = 1 << 16
+    HEADER = struct.Struct('<Q')
+    KEY_LENGTH = struct.Struct('<I')
+    VALUE = struct.Struct('<d')
+
+    def __init__(self, directory, name=None):
+        self.lock = Lock()
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / f"{name or os.getpid()}.db"
+        self.file = open(path, 'a+b')
+        if os.fstat(self.file.fileno()).st_size == 0:
+            self.file.truncate(self.INITIAL_SIZE)
+        self.map = mmap.mmap(self.file.fileno(), 0)
+        self.used = self.HEADER.unpack_from(self.map, 0)[0] or \
+            self.HEADER.size
+        self.positions = {key: offset
+                          for key, offset, _ in self.read_entries(self.map)}
+
+    @classmethod
+    def read_entries(cls, data):
+        """Yield (key, value offset, value) of every entry in data."""
+        used = cls.HEADER.unpack_from(data, 0)[0]
+        offset = cls.HEADER.size
+        while offset < used:
+            length = cls.KEY_LENGTH.unpack_from(data, offset)[0]
+            start = offset + cls.KEY_LENGTH.size
+            key = bytes(data[start:start + length]).decode()
+            offset = cls.value_offset(start + length)
+            yield key, offset, cls.VALUE.unpack_from(data, offset)[0]
+            offset += cls.VALUE.size
+
+    @staticmethod
+    def value_offset(end: int) -> int:
+        return (end + 7) & ~7
+
+    def inc(self, key: str, amount: float):
+        with self.lock:
+            offset = self.positions.get(key)
+            if offset is None:
+                offset = self.add_entry(key)
+            value = self.VALUE.unpack_from(self.map, offset)[0]
+            self.VALUE.pack_into(self.map, offset, value + amount)
+
+    def add_entry(self, key: str) -> int:
+        encoded = key.encode()
+        start = self.used + self.KEY_LENGTH.size
+        offset = self.value_offset(start + len(encoded))
+        end = offset + self.VALUE.size
+        if end > len(self.map):
+            size = len(self.map)
+            while size < end:
+                size *= 2
+            self.map.close()
+            self.file.truncate(size)
+            self.map = mmap.mmap(self.file.fileno(), 0)
+        self.KEY_LENGTH.pack_into(self.map, self.used, len(encoded))
+        self.map[start:start + len(encoded)] = encoded
+        self.VALUE.pack_into(self.map, offset, 0.0)
+        # Publish the entry only once it is complete.
+        self.used = end
+        self.HEADER.pack_into(self.map, 0, end)
+        self.positions[key] = offset
+        return offset
+
+    def collect(self) -> dict:
+        """Sum the samples of every process writing to the directory."""
+        values = {}
+        for path in sorted(self.directory.glob('*.db')):
+            for key, _, value in self.read_entries(path.read_bytes()):
+                values[key] = values.get(key, 0.0) + value
+        return values
+
+
+_store = None
+_store_pid = None
+
+
+def get_store():
+    """Return the store of this process, a new one after a fork."""
+    global _store, _store_pid
+    if _store is None or _store_pid != os.getpid():
+        directory = getattr(settings, 'METRICS_DIR', None)
+        _store = MmapStore(directory) if directory else MemoryStore()
+        _store_pid = os.getpid()
+    return _store
+
+
+def sample_key(name: str, labels) -> str:
+    return json.dumps([name, labels], separators=(',', ':'))
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name: str, documentation: str, labelnames=(),
+                 registry=None):
+        registry = _registry if registry is None else registry
+        if name in registry:
+            raise ValueError(f"Metric {name} is already registered.")
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        registry[name] = self
+
+    def label_values(self, labels: dict) -> list:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(
+                f"{self.name} takes the labels {self.labelnames}.")
+        return [str(labels[name]) for name in self.labelnames]
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        get_store().inc(sample_key(self.name, self.label_values(labels)),
+                        amount)
+
+
+class Histogram(Metric):
+    """Histogram storing every bucket apart, they are summed up on export."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(),
+                 buckets=DEFAULT_BUCKETS, registry=None):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(float(bound) for bound in buckets)
+
+    def observe(self, value: float, **labels):
+        values = self.label_values(labels)
+        position = bisect_left(self.buckets, value)
+        bound = self.bucket_label(position)
+        store = get_store()
+        store.inc(sample_key(f"{self.name}_bucket", values + [bound]), 1)
+        store.inc(sample_key(f"{self.name}_sum", values), value)
+        store.inc(sample_key(f"{self.name}_count", values), 1)
+
+    def bucket_label(self, position: int) -> str:
+        if position == len(self.buckets):
+            return '+Inf'
+        return repr(self.buckets[position])
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', r'\\').replace('\n', r'\n')\
+                .replace('"', r'\"')
+
+
+def _format(name: str, labelnames, values, value: float) -> str:
+    labels = ",".join(f'{label}="{_escape(text)}"'
+                      for label, text in zip(labelnames, values))
+    if labels:
+        name = f"{name}{{{labels}}}"
+    return f"{name} {value!r}"
+
+
+def render_metrics(registry=None) -> str:
+    """Return every registered metric in the Prometheus text format."""
+    registry = _registry if registry is None else registry
+    samples = {}
+    for key, value in get_store().collect().items():
+        name, values = json.loads(key)
+        samples.setdefault(name, {})[tuple(values)] = value
+
+    lines = []
+    for metric in registry.values():
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        if metric.kind == 'counter':
+            for values, value in sorted(
+                    samples.get(metric.name, {}).items()):
+                lines.append(_format(metric.name, metric.labelnames,
+                                     values, value))
+            continue
+
+        buckets = samples.get(f"{metric.name}_bucket", {})
+        sums = samples.get(f"{metric.name}_sum", {})
+        labelnames = metric.labelnames + ('le', )
+        for values, count in sorted(
+                samples.get(f"{metric.name}_count", {}).items()):
+            total = 0.0
+            for position in range(len(metric.buckets) + 1):
+                bound = metric.bucket_label(position)
+                total += buckets.get(values + (bound, ), 0.0)
+                lines.append(_format(f"{metric.name}_bucket", labelnames,
+                                     values + (bound, ), total))
+            lines.append(_format(f"{metric.name}_sum", metric.labelnames,
+                                 values, sums.get(values, 0.0)))
+            lines.append(_format(f"{metric.name}_count", metric.labelnames,
+                                 values, count))
+    return "\n".join(lines) + "\n"
+
+
+REQUEST_SECONDS = Histogram(
+    'http_request_duration_seconds',
+    "Time spent answering requests, by view action.",
+    ['view'])
+REQUESTS = Counter(
+    'http_requests_total', "Answered requests, by view action and status.",
+    ['view', 'status'])
+DB_QUERIES = Counter(
+    'db_queries_total', "Database queries run by requests, by view action.",
+    ['view'])
+JWT_AUTHENTICATIONS = Counter(
+    'jwt_authentications_total', "JWT authentication attempts by outcome.",
+    ['outcome'])
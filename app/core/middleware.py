@@ -0,0 +1,142 @@
+import cProfile
+import logging
+import random
+from contextlib import ExitStack
+from time import perf_counter
+
+from django.conf import settings
+from django.db import connections
+
+from core.metrics import DB_QUERIES, REQUEST_SECONDS, REQUESTS
+from core.profiling import is_valid_token, save_profile, view_key
+from core.timing import Timings, activate, current_timings, deactivate
+
+
+logger = logging.getLogger('core.timing')
+profiling_logger = logging.getLogger('core.profiling')
+
+
+class ServerTimingMiddleware:
+    """Report where the time of every request went.
+
+    Queries are counted and timed through an execute wrapper on every
+    database connection, render time from process_template_response to the
+    end of rendering, and views add their own phases with core.timing.timed.
+    The result is sent back in a Server-Timing header and logged on the
+    core.timing logger, with the numbers in the ``timing`` extra as well.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timings = Timings()
+        token = activate(timings)
+        began = perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timings))
+                response = self.get_response(request)
+        finally:
+            deactivate(token)
+        timings.add('total', perf_counter() - began)
+
+        response['Server-Timing'] = timings.header()
+        fields = {
+            "method": request.method,
+            "path": request.path,
+            "status": response.status_code,
+            "queries": timings.queries,
+            **{f"{name}_ms": round(seconds * 1000, 1)
+               for name, seconds in timings.durations.items()},
+        }
+        logger.info(" ".join(f"{key}={value}"
+                             for key, value in fields.items()),
+                    extra={"timing": fields})
+        return response
+
+    def process_template_response(self, request, response):
+        timings = current_timings()
+        began = perf_counter()
+
+        def rendered(response):
+            timings.add('render', perf_counter() - began)
+
+        response.add_post_render_callback(rendered)
+        return response
+
+
+class ProfilingMiddleware:
+    """Profile a sample of the requests with cProfile.
+
+    PROFILING_SAMPLE_RATE of the requests are profiled, plus every request
+    carrying an X-Profile header signed by core.profiling.make_token (see
+    the profile_token command). Dumps are stored per view action by
+    core.profiling and summed up by the profile_report command.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not self.should_profile(request):
+            return self.get_response(request)
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler is already active in this thread.
+            return self.get_response(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.disable()
+        try:
+            save_profile(profiler, view_key(request))
+        except OSError:
+            profiling_logger.exception(
+                "Could not save the profile of %s", request.path)
+        return response
+
+    def should_profile(self, request) -> bool:
+        token = request.headers.get('X-Profile')
+        if token is not None and is_valid_token(token):
+            return True
+        rate = getattr(settings, 'PROFILING_SAMPLE_RATE', 0)
+        return rate > 0 and random.random() < rate
+
+
+class QueryCounter:
+    """Execute wrapper counting the statements sent to the database."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class MetricsMiddleware:
+    """Record the latency, status and query count of requests per action."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = QueryCounter()
+        began = perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(queries))
+            response = self.get_response(request)
+        elapsed = perf_counter() - began
+
+        view = view_key(request)
+        REQUEST_SECONDS.observe(elapsed, view=view)
+        REQUESTS.inc(view=view, status=response.status_code)
+        if queries.count:
+            DB_QUERIES.inc(queries.count, view=view)
+        return response
@@ -0,0 +1,24 @@
+# Generated by Django 4.1.13 on 2026-10-18 08:39
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_exclusion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='history_depth',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='previous_event',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='next_events', to='core.event'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.1.13 on 2026-10-18 08:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_startjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='pairing',
+            field=models.BinaryField(null=True),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='pairing_mode',
+            field=models.CharField(choices=[('gifts', 'One Gift row per attender'), ('compact', 'Packed pairing stored on the event')], default='gifts', max_length=16),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='pairing_seed',
+            field=models.BigIntegerField(editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.1.13 on 2026-10-18 08:42
+
+from django.db import migrations, models
+
+
+def reset_double_started_events(apps, schema_editor):
+    """Unstart the events whose Gifts were created by two parallel starts.
+
+    The interleaved rows need not form a valid pairing any more, so all
+    the Gifts of those events are deleted and their moderators have to
+    start them again.
+    """
+    Event = apps.get_model('core', 'Event')
+    Gift = apps.get_model('core', 'Gift')
+    event_ids = Gift.objects.values('event_id', 'giver_id')\
+                            .annotate(count=models.Count('id'))\
+                            .filter(count__gt=1)\
+                            .values_list('event_id', flat=True)
+    event_ids = set(event_ids)
+    if not event_ids:
+        return
+    Gift.objects.filter(event_id__in=event_ids).delete()
+    Event.objects.filter(pk__in=event_ids).update(
+        is_start=False, pairing=None, pairing_seed=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_event_pairing'),
+    ]
+
+    operations = [
+        migrations.RunPython(reset_double_started_events,
+                             migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='gift',
+            constraint=models.UniqueConstraint(fields=('event', 'giver'), name='unique_event_giver'),
+        ),
+    ]
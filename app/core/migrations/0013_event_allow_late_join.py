@@ -0,0 +1,18 @@
+# Generated by Django 4.1.13 on 2026-10-18 08:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_gift_unique_event_giver'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='allow_late_join',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.1.13 on 2026-10-18 08:46
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_event_allow_late_join'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='group_size',
+            field=models.PositiveIntegerField(blank=True, null=True, validators=[django.core.validators.MinValueValidator(2)]),
+        ),
+    ]
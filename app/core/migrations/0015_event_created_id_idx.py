@@ -0,0 +1,17 @@
+# Generated by Django 4.1.13 on 2026-10-18 08:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_event_group_size'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['-date_created', '-id'], name='event_created_id_idx'),
+        ),
+    ]
@@ -3,6 +3,7 @@ import os
 
 from django.db import models
 from django.conf import settings
+from django.core.validators import MinValueValidator
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, \
                                         PermissionsMixin
 
@@ -54,18 +55,48 @@ class User(AbstractBaseUser, PermissionsMixin):
 
 
 class Event(models.Model):
+    GIFTS = "gifts"
+    COMPACT = "compact"
+    PAIRING_MODE_CHOICES = [
+        (GIFTS, "One Gift row per attender"),
+        (COMPACT, "Packed pairing stored on the event"),
+    ]
+
     title = models.CharField(max_length=128, blank=False, null=False)
     description = models.TextField(blank=True, null=True)
     location = models.CharField(max_length=128, blank=False, null=False)
     date_created = models.DateTimeField(auto_now_add=True)
     date_updated = models.DateTimeField(auto_now=True)
     is_start = models.BooleanField(default=False)
+    allow_late_join = models.BooleanField(default=False)
     moderator = models.ForeignKey(settings.AUTH_USER_MODEL,
                                   on_delete=models.PROTECT,
                                   related_name="moderated_events")
     attenders = models.ManyToManyField(settings.AUTH_USER_MODEL,
                                        related_name="events")
     image = models.ImageField(null=True, upload_to=event_image_file_path)
+    previous_event = models.ForeignKey("self",
+                                       null=True,
+                                       blank=True,
+                                       on_delete=models.SET_NULL,
+                                       related_name="next_events")
+    history_depth = models.PositiveSmallIntegerField(default=0)
+    group_size = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        validators=[MinValueValidator(2)]
+    )
+    pairing_mode = models.CharField(max_length=16,
+                                    choices=PAIRING_MODE_CHOICES,
+                                    default=GIFTS)
+    pairing_seed = models.BigIntegerField(null=True, editable=False)
+    pairing = models.BinaryField(null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["-date_created", "-id"],
+                         name="event_created_id_idx"),
+        ]
 
     def __str__(self) -> str:
         return f"<Event: '{self.title}' at '{self.location}'>"
@@ -81,3 +112,67 @@ class Gift(models.Model):
     event = models.ForeignKey("Event",
                               on_delete=models.CASCADE,
                               related_name="gifts")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["event", "giver"],
+                                    name="unique_event_giver"),
+        ]
+
+
+class Exclusion(models.Model):
+    """ Rule that giver must not buy a gift for reciver in the event """
+    event = models.ForeignKey("Event",
+                              on_delete=models.CASCADE,
+                              related_name="exclusions")
+    giver = models.ForeignKey(settings.AUTH_USER_MODEL,
+                              on_delete=models.CASCADE,
+                              related_name="+")
+    reciver = models.ForeignKey(settings.AUTH_USER_MODEL,
+                                on_delete=models.CASCADE,
+                                related_name="+")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["event", "giver", "reciver"],
+                                    name="unique_event_exclusion"),
+        ]
+
+
+class StartJob(models.Model):
+    """ Background job matching the attenders of an event """
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    ]
+
+    event = models.ForeignKey("Event",
+                              on_delete=models.CASCADE,
+                              related_name="start_jobs")
+    status = models.CharField(max_length=16,
+                              choices=STATUS_CHOICES,
+                              default=PENDING)
+    total = models.PositiveIntegerField(default=0)
+    processed = models.PositiveIntegerField(default=0)
+    message = models.TextField(blank=True, default="")
+    date_created = models.DateTimeField(auto_now_add=True)
+    date_updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self) -> str:
+        return f"<StartJob: {self.pk} of event {self.event_id} {self.status}>"
+
+
+class RevokedToken(models.Model):
+    """ JWT which must not be accepted anymore, until it expires """
+    jti = models.CharField(max_length=255, unique=True)
+    expires_at = models.DateTimeField(db_index=True)
+    date_created = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self) -> str:
+        return f"<RevokedToken: {self.jti}>"
@@ -0,0 +1,69 @@
+"""Storage of request profiles taken by ProfilingMiddleware.
+
+Dumps are pstats files in PROFILING_DIR, one directory per view action,
+named by time so the oldest ones are dropped first once a directory holds
+more than PROFILING_MAX_DUMPS of them.
+"""
+import os
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core import signing
+
+
+TOKEN_SALT = 'core.profiling'
+TOKEN_MAX_AGE = 60 * 60
+DEFAULT_DIR = '/tmp/secretsanta-profiles'
+DEFAULT_MAX_DUMPS = 50
+
+
+def profile_dir() -> Path:
+    return Path(getattr(settings, 'PROFILING_DIR', DEFAULT_DIR))
+
+
+def make_token() -> str:
+    """Return a value for the X-Profile header, valid for TOKEN_MAX_AGE."""
+    return signing.dumps('profile', salt=TOKEN_SALT)
+
+
+def is_valid_token(value: str) -> bool:
+    try:
+        signing.loads(value, salt=TOKEN_SALT, max_age=TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return False
+    return True
+
+
+def view_key(request) -> str:
+    """Name the view action which handled request, for the dump folder."""
+    match = request.resolver_match
+    if match is None:
+        return 'unresolved'
+    view = match.func
+    cls = getattr(view, 'cls', None)
+    if cls is None:
+        return f"{view.__module__}.{view.__qualname__}"
+    actions = getattr(view, 'actions', None) or {}
+    action = actions.get(request.method.lower(), request.method.lower())
+    return f"{cls.__name__}.{action}"
+
+
+def save_profile(profiler, key: str) -> Path:
+    """Dump profiler under key and drop the oldest dumps beyond the limit."""
+    folder = profile_dir() / key
+    folder.mkdir(parents=True, exist_ok=True)
+    path = folder / f"{time.time_ns()}-{os.getpid()}.prof"
+    profiler.dump_stats(path)
+
+    limit = getattr(settings, 'PROFILING_MAX_DUMPS', DEFAULT_MAX_DUMPS)
+    dumps = sorted(folder.glob('*.prof'))
+    for old in dumps[:-limit]:
+        old.unlink(missing_ok=True)
+    return path
+
+
+def list_dumps(key: str = None):
+    """Return the dump files, of one view action or of all of them."""
+    pattern = f"{key}/*.prof" if key else "*/*.prof"
+    return sorted(profile_dir().glob(pattern))
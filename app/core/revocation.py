@@ -0,0 +1,133 @@
+"""Revocation of JWTs by their jti, checked without a query per request.
+
+Revoked ids are stored as RevokedToken rows. Every process keeps a Bloom
+filter of them, which answers "certainly not revoked" for almost every
+token without touching the database; only the few tokens it may contain
+are looked up exactly. The filter picks up the rows added by other
+processes every JWT_REVOCATION_SYNC_INTERVAL seconds, so a token revoked
+elsewhere may still be accepted for that long, and is rebuilt from the
+unexpired rows every JWT_REVOCATION_REBUILD_INTERVAL seconds.
+"""
+import datetime
+import hashlib
+import math
+import time
+from threading import Lock
+
+from django.conf import settings
+from django.utils import timezone
+
+from rest_framework_simplejwt.settings import api_settings
+
+from core.models import RevokedToken
+
+
+SYNC_INTERVAL = 5
+REBUILD_INTERVAL = 60 * 60
+CAPACITY = 100000
+ERROR_RATE = 0.001
+# Rows are read again this long after the previous sync, so rows which
+# were committed a little after they got their date_created are not missed.
+SYNC_OVERLAP = datetime.timedelta(seconds=60)
+
+
+class BloomFilter:
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.size = max(8, math.ceil(
+            -capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def positions(self, item: str):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        for i in range(self.hashes):
+            yield (first + i * second) % self.size
+
+    def add(self, item: str):
+        for position in self.positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7))
+                   for position in self.positions(item))
+
+
+class RevocationList:
+    """Bloom filter of the revoked jtis, synced from the database."""
+
+    def __init__(self):
+        self.lock = Lock()
+        self.filter = None
+        self.entries = 0
+        self.synced_at = None
+        self.next_sync = 0
+        self.next_rebuild = 0
+
+    def is_revoked(self, jti: str) -> bool:
+        self.maybe_sync()
+        if jti not in self.filter:
+            return False
+        return RevokedToken.objects.filter(jti=jti).exists()
+
+    def add(self, jti: str):
+        self.maybe_sync()
+        with self.lock:
+            self.filter.add(jti)
+            self.entries += 1
+
+    def maybe_sync(self):
+        if time.monotonic() < self.next_sync:
+            return
+        with self.lock:
+            if time.monotonic() >= self.next_sync:
+                self.sync()
+
+    def sync(self):
+        """Read the new rows, or all unexpired ones if a rebuild is due."""
+        now = timezone.now()
+        capacity = getattr(settings, 'JWT_REVOCATION_CAPACITY', CAPACITY)
+        if self.filter is None or time.monotonic() >= self.next_rebuild or \
+                self.entries > capacity:
+            self.filter = BloomFilter(capacity, ERROR_RATE)
+            self.entries = 0
+            rows = RevokedToken.objects.filter(expires_at__gt=now)
+            self.next_rebuild = time.monotonic() + getattr(
+                settings, 'JWT_REVOCATION_REBUILD_INTERVAL', REBUILD_INTERVAL)
+            since = None
+        else:
+            since = self.synced_at
+            rows = RevokedToken.objects.filter(
+                date_created__gte=since - SYNC_OVERLAP)
+        rows = rows.values_list('jti', 'date_created').iterator()
+        for jti, date_created in rows:
+            self.filter.add(jti)
+            if since is None or date_created >= since:
+                self.entries += 1
+        self.synced_at = now
+        self.next_sync = time.monotonic() + getattr(
+            settings, 'JWT_REVOCATION_SYNC_INTERVAL', SYNC_INTERVAL)
+
+    def reset(self):
+        with self.lock:
+            self.filter = None
+            self.next_sync = 0
+
+
+revocation_list = RevocationList()
+
+
+def is_revoked(token) -> bool:
+    return revocation_list.is_revoked(token[api_settings.JTI_CLAIM])
+
+
+def revoke(token):
+    """Refuse token from now on, in this process at once."""
+    jti = token[api_settings.JTI_CLAIM]
+    expires_at = datetime.datetime.fromtimestamp(token['exp'],
+                                                 tz=datetime.timezone.utc)
+    RevokedToken.objects.get_or_create(jti=jti,
+                                       defaults={'expires_at': expires_at})
+    revocation_list.add(jti)
@@ -0,0 +1,72 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from core.authentication import user_cache_key
+from core.revocation import revocation_list
+
+
+EVENT_URL = reverse("santa:event-list")
+
+
+def user_queries(context) -> int:
+    return sum('FROM "core_user"' in query['sql']
+               for query in context.captured_queries)
+
+
+@override_settings(JWT_REVOCATION_SYNC_INTERVAL=3600)
+class CachedUserTests(TestCase):
+
+    def setUp(self) -> None:
+        revocation_list.reset()
+        revocation_list.sync()
+        self.user = get_user_model().objects.create_user(username="ATPJ")
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}")
+
+    def test_user_is_loaded_once(self):
+        with self.assertNumQueries(2) as first:
+            self.client.get(EVENT_URL)
+        with self.assertNumQueries(1) as second:
+            res = self.client.get(EVENT_URL)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(user_queries(first), 1)
+        self.assertEqual(user_queries(second), 0)
+
+    def test_saving_the_user_invalidates(self):
+        self.client.get(EVENT_URL)
+        self.assertIsNotNone(cache.get(user_cache_key(self.user.pk)))
+
+        self.user.is_active = False
+        self.user.save()
+        res = self.client.get(EVENT_URL)
+
+        self.assertEqual(res.status_code, 401)
+
+    def test_deleted_user(self):
+        self.client.get(EVENT_URL)
+        self.user.delete()
+
+        res = self.client.get(EVENT_URL)
+
+        self.assertEqual(res.status_code, 401)
+
+    @override_settings(JWT_CLAIMS_ONLY_READS=True)
+    def test_claims_only_reads(self):
+        with self.assertNumQueries(1) as read:
+            res = self.client.get(EVENT_URL)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(user_queries(read), 0)
+        res = self.client.get(reverse("santa:event-my-gifts"))
+        self.assertEqual(res.status_code, 200)
+
+        res = self.client.post(EVENT_URL, {"title": "Title",
+                                           "location": "At Cafe"})
+        self.assertEqual(res.status_code, 201)
+        self.assertEqual(res.data['moderator'], self.user.pk)
@@ -0,0 +1,145 @@
+import re
+import tempfile
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from core import metrics
+from core.models import Event
+
+
+def sample_value(text: str, sample: str) -> float:
+    match = re.search(rf"^{re.escape(sample)} (\S+)$", text, re.MULTILINE)
+    return float(match.group(1)) if match else 0.0
+
+
+class MmapStoreTests(SimpleTestCase):
+
+    def setUp(self) -> None:
+        self.folder = tempfile.TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+
+    def test_processes_are_summed_up(self):
+        first = metrics.MmapStore(self.folder.name, "1")
+        second = metrics.MmapStore(self.folder.name, "2")
+        first.inc("a", 1)
+        first.inc("a", 2)
+        second.inc("a", 4)
+        second.inc("b", 0.5)
+
+        self.assertEqual(first.collect(), {"a": 7.0, "b": 0.5})
+        self.assertEqual(second.collect(), first.collect())
+
+    def test_grows_and_reopens(self):
+        store = metrics.MmapStore(self.folder.name, "1")
+        for i in range(5000):
+            store.inc(f"key-{i}", i)
+
+        reopened = metrics.MmapStore(self.folder.name, "1")
+        reopened.inc("key-10", 1)
+
+        values = reopened.collect()
+        self.assertEqual(len(values), 5000)
+        self.assertEqual(values["key-10"], 11.0)
+        self.assertEqual(values["key-4999"], 4999.0)
+
+
+class RenderTests(SimpleTestCase):
+
+    def test_histogram_and_counter(self):
+        registry = {}
+        histogram = metrics.Histogram("latency_seconds", "Latency.",
+                                      ["view"], buckets=(.1, 1),
+                                      registry=registry)
+        counter = metrics.Counter("hits_total", "Hits.", ["view"],
+                                  registry=registry)
+        with patch.object(metrics, "_store", metrics.MemoryStore()), \
+                patch.object(metrics, "_store_pid", metrics.os.getpid()):
+            histogram.observe(.05, view="a")
+            histogram.observe(.5, view="a")
+            histogram.observe(5, view="a")
+            counter.inc(view='say "hi"')
+            text = metrics.render_metrics(registry)
+
+        self.assertEqual(text.splitlines(), [
+            "# HELP latency_seconds Latency.",
+            "# TYPE latency_seconds histogram",
+            'latency_seconds_bucket{view="a",le="0.1"} 1.0',
+            'latency_seconds_bucket{view="a",le="1.0"} 2.0',
+            'latency_seconds_bucket{view="a",le="+Inf"} 3.0',
+            'latency_seconds_sum{view="a"} 5.55',
+            'latency_seconds_count{view="a"} 3.0',
+            "# HELP hits_total Hits.",
+            "# TYPE hits_total counter",
+            'hits_total{view="say \\"hi\\""} 1.0',
+        ])
+
+    def test_wrong_labels(self):
+        counter = metrics.Counter("other_total", "Other.", ["view"],
+                                  registry={})
+
+        with self.assertRaises(ValueError):
+            counter.inc(action="list")
+
+
+@override_settings(SECRETSANTA_START_ASYNC=False)
+class MetricsEndpointTests(TestCase):
+
+    def setUp(self) -> None:
+        self.user = get_user_model().objects.create_user(username="ATPJ")
+        self.other = get_user_model().objects.create_user(username="Mina")
+        self.client = APIClient()
+
+    def test_request_and_domain_metrics(self):
+        before = self.client.get(reverse("metrics")).content.decode()
+        event = Event.objects.create(title="Title", location="At Cafe",
+                                     moderator=self.user)
+        event.attenders.add(self.user, self.other)
+
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}")
+        self.client.get(reverse("santa:event-list"))
+        self.client.post(reverse("santa:event-start", args=(event.id, )))
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer broken")
+        self.client.get(reverse("santa:event-list"))
+
+        res = self.client.get(reverse("metrics"))
+        after = res.content.decode()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res['Content-Type'].startswith("text/plain"))
+        for sample, delta in [
+            ('http_request_duration_seconds_count'
+             '{view="EventViewSet.list"}', 2),
+            ('http_requests_total'
+             '{view="EventViewSet.list",status="401"}', 1),
+            ('jwt_authentications_total{outcome="success"}', 2),
+            ('jwt_authentications_total{outcome="invalid_token"}', 1),
+            ('secretsanta_matching_duration_seconds_count'
+             '{pairing_mode="gifts"}', 1),
+            ('secretsanta_gifts_created_total{pairing_mode="gifts"}', 2),
+        ]:
+            self.assertEqual(sample_value(after, sample) -
+                             sample_value(before, sample), delta, sample)
+        self.assertGreater(
+            sample_value(after, 'db_queries_total'
+                                '{view="EventViewSet.list"}'), 0)
+
+    @override_settings(METRICS_TOKEN="secret")
+    def test_access_is_restricted(self):
+        url = reverse("metrics")
+        outsider = {"REMOTE_ADDR": "203.0.113.7"}
+
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(self.client.get(url, **outsider).status_code, 403)
+        res = self.client.get(url, HTTP_AUTHORIZATION="Bearer wrong",
+                              **outsider)
+        self.assertEqual(res.status_code, 403)
+        res = self.client.get(url, HTTP_AUTHORIZATION="Bearer secret",
+                              **outsider)
+        self.assertEqual(res.status_code, 200)
@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core.models import Event
+from core.timing import current_timings, timed
+
+
+@override_settings(MIDDLEWARE=['core.middleware.ServerTimingMiddleware',
+                               *settings.MIDDLEWARE])
+class ServerTimingMiddlewareTests(TestCase):
+
+    def setUp(self) -> None:
+        self.user = get_user_model().objects.create_user(username="ATPJ")
+        event = Event.objects.create(title="Title", location="At Cafe",
+                                     moderator=self.user)
+        event.attenders.add(self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_server_timing_header_and_log(self):
+        with self.assertLogs('core.timing', level='INFO') as logs:
+            res = self.client.get(reverse("santa:event-list"))
+
+        metrics = {metric.split(';')[0]: metric
+                   for metric in res['Server-Timing'].split(', ')}
+        self.assertEqual(
+            set(metrics),
+            {'authentication', 'permissions', 'db', 'serialize', 'render',
+             'total'})
+        self.assertIn('desc="2 queries"', metrics['db'])
+
+        record = logs.records[0]
+        self.assertEqual(record.timing['queries'], 2)
+        self.assertEqual(record.timing['status'], 200)
+        self.assertIn('path=/api/secretsanta/event/', record.getMessage())
+
+    def test_timed_without_active_timings(self):
+        with timed('serialize'):
+            pass
+        self.assertIsNone(current_timings())
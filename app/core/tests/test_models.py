@@ -1,5 +1,6 @@
 from unittest.mock import patch
 
+from django.db import IntegrityError
 from django.test import TestCase
 from django.contrib.auth import get_user_model
 
@@ -93,6 +94,16 @@ class TestModels(TestCase):
         self.assertEqual(gift.reciver, user2)
         self.assertEqual(gift.event, event)
 
+    def test_giver_has_one_gift_per_event(self):
+        user1 = sample_user(username="atpj", password="atpj1234")
+        user2 = sample_user(username="majid", password="majid1234")
+        event = sample_event(moderator=user1)
+        models.Gift.objects.create(giver=user1, reciver=user2, event=event)
+
+        with self.assertRaises(IntegrityError):
+            models.Gift.objects.create(giver=user1, reciver=user1,
+                                       event=event)
+
     @patch('core.models.uuid.uuid4')
     def test_event_image_file_name(self, mock_uuid):
         """Test generating image path name."""
@@ -0,0 +1,69 @@
+import tempfile
+from io import StringIO
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core.profiling import make_token
+
+
+EVENT_URL = reverse("santa:event-list")
+
+
+class ProfilingMiddlewareTests(TestCase):
+
+    def setUp(self) -> None:
+        self.folder = tempfile.TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+        settings = override_settings(PROFILING_DIR=self.folder.name,
+                                     PROFILING_SAMPLE_RATE=0,
+                                     PROFILING_MAX_DUMPS=2)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        user = get_user_model().objects.create_user(username="ATPJ")
+        self.client = APIClient()
+        self.client.force_authenticate(user=user)
+
+    def dumps(self):
+        return sorted(Path(self.folder.name).glob("*/*.prof"))
+
+    def test_not_sampled(self):
+        self.client.get(EVENT_URL)
+        self.client.get(EVENT_URL, HTTP_X_PROFILE="forged")
+
+        self.assertEqual(self.dumps(), [])
+
+    def test_signed_header(self):
+        res = self.client.get(EVENT_URL, HTTP_X_PROFILE=make_token())
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual([dump.parent.name for dump in self.dumps()],
+                         ["EventViewSet.list"])
+
+    @override_settings(PROFILING_SAMPLE_RATE=1)
+    def test_sampled_dumps_rotate(self):
+        for _ in range(3):
+            self.client.get(EVENT_URL)
+
+        self.assertEqual(len(self.dumps()), 2)
+
+    @override_settings(PROFILING_SAMPLE_RATE=1)
+    def test_profile_report(self):
+        self.client.get(EVENT_URL)
+        out = StringIO()
+
+        call_command('profile_report', '--action', 'EventViewSet.list',
+                     '--limit', '5', stdout=out)
+
+        self.assertIn("1 profiles of EventViewSet.list", out.getvalue())
+        self.assertIn("function calls", out.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('profile_report', '--action', 'Nothing.list',
+                         stdout=StringIO())
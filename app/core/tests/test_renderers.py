@@ -0,0 +1,52 @@
+import datetime
+import decimal
+import uuid
+
+from django.test import SimpleTestCase
+
+from rest_framework.renderers import JSONRenderer
+
+from core.renderers import ORJSONRenderer, stream_json_object
+
+
+SAMPLE = {
+    "id": 1,
+    "title": "Ünïcode \"quoted\" \u2028 \u2029 line",
+    "when": datetime.datetime(2023, 12, 24, 18, 30, 5, 123456,
+                              tzinfo=datetime.timezone.utc),
+    "day": datetime.date(2023, 12, 24),
+    "price": decimal.Decimal("12.50"),
+    "key": uuid.UUID(int=7),
+    "nested": [{"a": None, "b": True, "c": 1.5}, []],
+    "empty": {},
+}
+
+
+class ORJSONRendererTests(SimpleTestCase):
+
+    def test_same_bytes_as_json_renderer(self):
+        self.assertEqual(ORJSONRenderer().render(SAMPLE),
+                         JSONRenderer().render(SAMPLE))
+
+    def test_unencodable_data_falls_back(self):
+        data = {"big": 2 ** 70, "nested": [-2 ** 64]}
+
+        self.assertEqual(ORJSONRenderer().render(data),
+                         JSONRenderer().render(data))
+
+    def test_indented_output_falls_back(self):
+        self.assertEqual(
+            ORJSONRenderer().render(SAMPLE, 'application/json; indent=2'),
+            JSONRenderer().render(SAMPLE, 'application/json; indent=2'))
+
+    def test_stream_json_object(self):
+        renderer = ORJSONRenderer()
+        for key in ("first", "middle", "last"):
+            data = {"first": [], "title": "x", "middle": [], "n": 2,
+                    "last": []}
+            data[key] = list(range(5000))
+            streamed = dict(data, **{key: iter(data[key])})
+
+            self.assertEqual(
+                b"".join(stream_json_object(renderer, streamed, key)),
+                renderer.render(data))
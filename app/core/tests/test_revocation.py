@@ -0,0 +1,110 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from core.models import RevokedToken
+from core.revocation import BloomFilter, revocation_list, revoke
+
+
+EVENT_URL = reverse("santa:event-list")
+LOGOUT_URL = reverse("account:logout")
+REFRESH_TOKEN_URL = reverse("account:refresh-token")
+
+
+def revocation_queries(context) -> int:
+    return sum('"core_revokedtoken"' in query['sql']
+               for query in context.captured_queries)
+
+
+class BloomFilterTests(TestCase):
+
+    def test_added_items_are_contained(self):
+        bloom = BloomFilter(1000, 0.001)
+        for i in range(1000):
+            bloom.add(f"jti-{i}")
+
+        self.assertTrue(all(f"jti-{i}" in bloom for i in range(1000)))
+        false_positives = sum(f"other-{i}" in bloom for i in range(10000))
+        self.assertLess(false_positives, 50)
+
+
+@override_settings(JWT_REVOCATION_SYNC_INTERVAL=3600)
+class RevocationTests(TestCase):
+
+    def setUp(self) -> None:
+        revocation_list.reset()
+        self.user = get_user_model().objects.create_user(
+            username="ATPJ", password="atpj1234")
+        self.refresh = RefreshToken.for_user(self.user)
+        self.access = self.refresh.access_token
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.access}")
+
+    def test_valid_token_costs_no_query(self):
+        self.client.get(EVENT_URL)
+
+        with self.assertNumQueries(1) as context:
+            res = self.client.get(EVENT_URL)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(revocation_queries(context), 0)
+
+    def test_logout(self):
+        res = self.client.post(LOGOUT_URL, {"refresh": str(self.refresh)})
+        self.assertEqual(res.status_code, 204)
+
+        res = self.client.get(EVENT_URL)
+        self.assertEqual(res.status_code, 401)
+        res = APIClient().post(REFRESH_TOKEN_URL,
+                               {"refresh": str(self.refresh)})
+        self.assertEqual(res.status_code, 401)
+        self.assertNotIn("access", res.data)
+
+    def test_logout_requires_the_refresh_token(self):
+        res = self.client.post(LOGOUT_URL, {})
+
+        self.assertEqual(res.status_code, 400)
+        self.assertFalse(RevokedToken.objects.exists())
+
+    def test_logout_with_someone_elses_refresh_token(self):
+        other = get_user_model().objects.create_user(username="Foureyed")
+
+        res = self.client.post(
+            LOGOUT_URL, {"refresh": str(RefreshToken.for_user(other))})
+
+        self.assertEqual(res.status_code, 400)
+        self.assertFalse(RevokedToken.objects.exists())
+
+    def test_revocation_in_another_process_is_synced(self):
+        self.client.get(EVENT_URL)
+        # A row written by another process is not in this filter yet.
+        RevokedToken.objects.create(
+            jti=self.access['jti'],
+            expires_at=self.access.current_time + self.access.lifetime)
+        self.assertEqual(self.client.get(EVENT_URL).status_code, 200)
+
+        revocation_list.next_sync = 0
+        res = self.client.get(EVENT_URL)
+
+        self.assertEqual(res.status_code, 401)
+
+    def test_rebuild_keeps_only_unexpired_revocations(self):
+        revoke(self.access)
+        revocation_list.reset()
+
+        res = self.client.get(EVENT_URL)
+
+        self.assertEqual(res.status_code, 401)
+
+    def test_password_change_invalidates_tokens(self):
+        self.user.set_password("newatpjpass")
+        self.user.save()
+
+        res = self.client.get(EVENT_URL)
+        self.assertEqual(res.status_code, 401)
+        res = APIClient().post(REFRESH_TOKEN_URL,
+                               {"refresh": str(self.refresh)})
+        self.assertEqual(res.status_code, 401)
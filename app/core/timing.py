@@ -0,0 +1,88 @@
+"""Per request timing of database, permission and serialization work.
+
+A Timings object is activated for the request by ServerTimingMiddleware.
+Code measures a phase with ``with timed("serialize"):``; without an active
+Timings (the middleware is not installed, or outside a request) it costs a
+single context variable lookup.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+
+
+_current = ContextVar('timings', default=None)
+
+
+class Timings:
+    """Durations of the phases of one request, in seconds.
+
+    Instances are also database execute wrappers counting the queries and
+    the time spent in them.
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.durations = {}
+
+    def add(self, name: str, seconds: float):
+        self.durations[name] = self.durations.get(name, 0.0) + seconds
+
+    def __call__(self, execute, sql, params, many, context):
+        began = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.add('db', perf_counter() - began)
+
+    def header(self) -> str:
+        """Return the value of the Server-Timing header."""
+        metrics = []
+        for name, seconds in self.durations.items():
+            metric = f"{name};dur={seconds * 1000:.1f}"
+            if name == 'db':
+                metric += f';desc="{self.queries} queries"'
+            metrics.append(metric)
+        return ", ".join(metrics)
+
+
+def activate(timings: Timings):
+    return _current.set(timings)
+
+
+def deactivate(token):
+    _current.reset(token)
+
+
+def current_timings():
+    return _current.get()
+
+
+@contextmanager
+def timed(name: str):
+    """Add the time spent in the block to the phase name of the request."""
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    began = perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, perf_counter() - began)
+
+
+class TimedAPIViewMixin:
+    """Time authentication and permission checks of a DRF view."""
+
+    def perform_authentication(self, request):
+        with timed('authentication'):
+            super().perform_authentication(request)
+
+    def check_permissions(self, request):
+        with timed('permissions'):
+            super().check_permissions(request)
+
+    def check_object_permissions(self, request, obj):
+        with timed('permissions'):
+            super().check_object_permissions(request, obj)
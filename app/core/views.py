@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+
+from core.metrics import render_metrics
+
+
+def may_read_metrics(request) -> bool:
+    """Allow the addresses of METRICS_ALLOWED_IPS or the METRICS_TOKEN."""
+    if request.META.get('REMOTE_ADDR') in getattr(
+            settings, 'METRICS_ALLOWED_IPS', ()):
+        return True
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    return bool(token) and constant_time_compare(
+        request.headers.get('Authorization', ''), f"Bearer {token}")
+
+
+def metrics(request):
+    """Expose the application metrics in the Prometheus text format"""
+    if not may_read_metrics(request):
+        return HttpResponseForbidden()
+    return HttpResponse(render_metrics(),
+                        content_type='text/plain; version=0.0.4; '
+                                     'charset=utf-8')
@@ -0,0 +1,67 @@
+"""Conditional GET support for event and gift detail.
+
+Validators are built from the event row alone: every change to an event,
+its attenders or its matching moves date_updated, so an ETag made of the
+event id and that timestamp changes whenever the serialized body would.
+A gift belongs to one giver, so its ETag also holds the user id.
+"""
+import hashlib
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+def event_etag(event_id: int, date_updated) -> str:
+    return quote_etag(f"event-{event_id}-{date_updated.timestamp():.6f}")
+
+
+def gift_etag(event_id: int, date_updated, user_id: int) -> str:
+    return quote_etag(
+        f"gift-{event_id}-{user_id}-{date_updated.timestamp():.6f}")
+
+
+def gift_list_etag(request, events, has_next: bool) -> str:
+    """ETag of one page of the user's gifts, built from its events.
+
+    Unlike a single event, a page also changes when events join or leave it,
+    so the tag hashes the ids and timestamps of the whole page together with
+    the requested cursor.
+    """
+    digest = hashlib.sha1(
+        f"{request.user.pk}:{request.get_full_path()}:{has_next}".encode())
+    for event in events:
+        digest.update(f":{event.pk}-{event.date_updated.timestamp():.6f}"
+                      .encode())
+    return quote_etag(f"gifts-{digest.hexdigest()}")
+
+
+def with_profiles(etag: str, users) -> str:
+    """Extend etag with the public profile of users.
+
+    Profiles are not part of the event row, so responses embedding them
+    are validated after the users are loaded.
+    """
+    digest = hashlib.sha1(etag.encode())
+    for user in users:
+        digest.update(f":{user.pk}:{user.username}:{user.name}".encode())
+    return quote_etag(f"profiles-{digest.hexdigest()}")
+
+
+def has_preconditions(request) -> bool:
+    return 'HTTP_IF_NONE_MATCH' in request.META or \
+        'HTTP_IF_MODIFIED_SINCE' in request.META
+
+
+def not_modified(request, etag: str, last_modified=None):
+    """Return a 304 response if the client copy is fresh, else None."""
+    if last_modified is not None:
+        last_modified = int(last_modified.timestamp())
+    return get_conditional_response(request, etag=etag,
+                                    last_modified=last_modified)
+
+
+def set_validators(response, etag: str, last_modified=None):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    return response
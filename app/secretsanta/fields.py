@@ -0,0 +1,57 @@
+from django.core.exceptions import ValidationError as DjangoValidationError
+
+from rest_framework import serializers
+from rest_framework.relations import MANY_RELATION_KWARGS, ManyRelatedField
+
+
+class BulkManyRelatedField(ManyRelatedField):
+    """Many related field resolving all submitted values at once."""
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+
+        return self.child_relation.to_internal_value_many(data)
+
+
+class BulkPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """Primary key field which, with many=True, validates with one query.
+
+    The stock field runs one SELECT per submitted pk. Here the pks are
+    converted first, then looked up together with in_bulk; every pk which
+    does not exist is reported with the usual does_not_exist message.
+    """
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return BulkManyRelatedField(**list_kwargs)
+
+    def to_internal_value_many(self, data):
+        queryset = self.get_queryset()
+        pk = queryset.model._meta.pk
+        pks = []
+        for value in data:
+            if self.pk_field is not None:
+                value = self.pk_field.to_internal_value(value)
+            try:
+                if isinstance(value, bool):
+                    raise TypeError
+                pks.append(pk.to_python(value))
+            except (TypeError, ValueError, DjangoValidationError):
+                self.fail('incorrect_type', data_type=type(value).__name__)
+
+        objects = queryset.in_bulk(set(pks))
+        missing = [value for value in dict.fromkeys(pks)
+                   if value not in objects]
+        if missing:
+            raise serializers.ValidationError([
+                self.error_messages['does_not_exist'].format(pk_value=value)
+                for value in missing
+            ], code='does_not_exist')
+        return [objects[value] for value in pks]
@@ -0,0 +1,200 @@
+"""Run event starts in a local background worker.
+
+Every start is recorded as a StartJob row and executed by a thread pool
+living in the web process, so no external broker is needed. The event row
+is only locked to queue a job; the attenders are matched and the Gift rows
+written without holding it, and the event is marked started at the end
+only if it did not change meanwhile, else the attenders are matched again.
+
+While a job runs, a heartbeat thread of its own, with its own database
+connection, touches the job row every SECRETSANTA_START_HEARTBEAT seconds
+and copies the progress into it. The progress is also published through
+the cache at once; only with a cache shared by the web processes
+(Memcached, Redis) do status requests served by other processes see it
+before the next heartbeat.
+
+Jobs die with the process running them. A running job without a heartbeat,
+or a job still pending, for SECRETSANTA_START_JOB_TIMEOUT seconds is taken
+as abandoned and marked failed, so starting the event again queues a new
+one. A failed job is never picked up any more.
+"""
+import datetime
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, IntegrityError, connections, \
+    transaction
+from django.utils import timezone
+
+from core.models import Event, StartJob
+
+from secretsanta.matching import MatchingInfeasible
+from secretsanta.utils import locked_events, match_event, store_matching
+
+
+logger = logging.getLogger(__name__)
+
+PROGRESS_TIMEOUT = 60 * 60
+JOB_TIMEOUT = 10 * 60
+HEARTBEAT_INTERVAL = 30
+START_ATTEMPTS = 3
+
+_executor = None
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'SECRETSANTA_START_WORKERS', 2),
+            thread_name_prefix="secretsanta-start",
+        )
+    return _executor
+
+
+def progress_key(job_id: int) -> str:
+    return f"secretsanta:start-job:{job_id}:processed"
+
+
+class Heartbeat(threading.Thread):
+    """Touch the row of a running job until stopped, with the progress."""
+
+    def __init__(self, job_id: int):
+        super().__init__(name=f"secretsanta-start-heartbeat-{job_id}",
+                         daemon=True)
+        self.job_id = job_id
+        self.processed = 0
+        self.stopped = threading.Event()
+
+    def progress(self, processed: int):
+        self.processed = processed
+        cache.set(progress_key(self.job_id), processed, PROGRESS_TIMEOUT)
+
+    def beat(self):
+        StartJob.objects.filter(pk=self.job_id, status=StartJob.RUNNING)\
+                        .update(processed=self.processed,
+                                date_updated=timezone.now())
+
+    def run(self):
+        interval = getattr(settings, 'SECRETSANTA_START_HEARTBEAT',
+                           HEARTBEAT_INTERVAL)
+        try:
+            while not self.stopped.wait(interval):
+                try:
+                    self.beat()
+                except DatabaseError:
+                    logger.exception("Heartbeat of start job %s failed",
+                                     self.job_id)
+        finally:
+            connections.close_all()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def job_progress(job: StartJob) -> int:
+    """Return how many Gifts the job has written so far."""
+    if job.status == StartJob.RUNNING:
+        return cache.get(progress_key(job.pk), job.processed)
+    return job.processed
+
+
+def enqueue_event_start(event: Event):
+    """Return the active StartJob of event, queueing a new one if needed.
+
+    The event row is locked while looking for an active job, so parallel
+    requests all get the same job; running jobs do not hold that lock, so
+    the answer is immediate. An active job whose row was not touched for
+    the timeout, though running jobs beat regularly, was abandoned and is
+    failed instead of returned. Returns None if the
+    event is already started. With SECRETSANTA_START_ASYNC disabled the job
+    is run before returning.
+    """
+    run_async = getattr(settings, 'SECRETSANTA_START_ASYNC', True)
+    with transaction.atomic():
+        locked = locked_events().only('is_start').get(pk=event.pk)
+        if locked.is_start:
+            return None
+        active = locked.start_jobs.filter(
+            status__in=[StartJob.PENDING, StartJob.RUNNING])
+        now = timezone.now()
+        stale_before = now - datetime.timedelta(seconds=getattr(
+            settings, 'SECRETSANTA_START_JOB_TIMEOUT', JOB_TIMEOUT))
+        active.filter(date_updated__lt=stale_before).update(
+            status=StartJob.FAILED, date_updated=now,
+            message="Abandoned, the process running it stopped.")
+        job = active.first()
+        if job is not None:
+            return job
+        job = StartJob.objects.create(event=locked,
+                                      total=event.attenders.count())
+        if run_async:
+            transaction.on_commit(
+                partial(get_executor().submit, run_start_job, job.pk))
+
+    if not run_async:
+        run_start_job(job.pk)
+        job.refresh_from_db()
+    return job
+
+
+def run_start_job(job_id: int):
+    try:
+        _run_start_job(job_id)
+    except Exception:
+        logger.exception("Start job %s crashed", job_id)
+        StartJob.objects.filter(pk=job_id).update(
+            status=StartJob.FAILED, message="Internal error")
+    finally:
+        if getattr(settings, 'SECRETSANTA_START_ASYNC', True):
+            connections.close_all()
+
+
+def _run_start_job(job_id: int):
+    # A pending job failed as abandoned must not run any more.
+    if not StartJob.objects.filter(pk=job_id, status=StartJob.PENDING)\
+                           .update(status=StartJob.RUNNING,
+                                   date_updated=timezone.now()):
+        return
+    job = StartJob.objects.get(pk=job_id)
+    heartbeat = Heartbeat(job.pk)
+    heartbeat.start()
+    try:
+        for _ in range(START_ATTEMPTS):
+            event = Event.objects.defer('pairing').get(pk=job.event_id)
+            if event.is_start:
+                _set_status(job, StartJob.FAILED,
+                            message="Event is already started.")
+                return
+            givers, recivers, seed = match_event(event)
+            if store_matching(event, givers, recivers, seed,
+                              progress=heartbeat.progress, start=True):
+                _set_status(job, StartJob.DONE, total=len(givers),
+                            processed=len(givers))
+                return
+    except MatchingInfeasible as exc:
+        _set_status(job, StartJob.FAILED, message=str(exc))
+        return
+    except IntegrityError:
+        # Another job wrote the Gift rows of the event meanwhile.
+        _set_status(job, StartJob.FAILED,
+                    message="Event is already started.")
+        return
+    finally:
+        heartbeat.stop()
+        cache.delete(progress_key(job.pk))
+
+    _set_status(job, StartJob.FAILED,
+                message="The attenders kept changing, start the event again.")
+
+
+def _set_status(job: StartJob, status: str, **fields):
+    job.status = status
+    for name, value in fields.items():
+        setattr(job, name, value)
+    job.save(update_fields=['status', 'date_updated', *fields])
@@ -0,0 +1,235 @@
+import json
+import os
+import platform
+import random
+import time
+import tracemalloc
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from core.middleware import QueryCounter
+from core.models import Event, Gift
+
+from secretsanta.matching import (
+    CycleMatcher,
+    ExclusionMatcher,
+    match_in_groups
+)
+from secretsanta.utils import (
+    GIFT_BATCH_SIZE,
+    match_and_create_gift_for_attenders
+)
+
+
+DEFAULT_SIZES = "10,100,1000,10000,100000,1000000"
+EXCLUSIONS_PER_ATTENDER = 2
+GROUP_SIZE = 1000
+SEED = 2023
+
+# Differences below these are noise, whatever the relative change.
+NOISE_FLOOR = {"seconds": 0.005, "peak_bytes": 64 * 1024, "queries": 0}
+
+
+def legacy_match_and_create(event: Event):
+    """The original row-by-row start path, kept for comparison."""
+    attenders = list(event.attenders.all())
+    random.shuffle(attenders)
+    for i in range(len(attenders)):
+        reciver = attenders[(i + 1) % len(attenders)]
+        Gift.objects.create(giver=attenders[i], reciver=reciver, event=event)
+    return True
+
+
+def sample_exclusions(attender_ids, rng):
+    return [(giver, rng.choice(attender_ids))
+            for giver in attender_ids
+            for _ in range(EXCLUSIONS_PER_ATTENDER)]
+
+
+def match_cycle(attender_ids, exclusions):
+    return CycleMatcher(SEED).match(attender_ids)
+
+
+def match_exclusion(attender_ids, exclusions):
+    return ExclusionMatcher(SEED).match(attender_ids, exclusions)
+
+
+def match_grouped(attender_ids, exclusions):
+    groups = [attender_ids[i:i + GROUP_SIZE]
+              for i in range(0, len(attender_ids), GROUP_SIZE)]
+    if len(groups) > 1 and len(groups[-1]) < 2:
+        groups[-2] = groups[-2] + groups.pop()
+    return match_in_groups(ExclusionMatcher, SEED, groups, exclusions,
+                           max_workers=os.cpu_count())
+
+
+MATCHING_STRATEGIES = {
+    'cycle': match_cycle,
+    'exclusion': match_exclusion,
+    'grouped': match_grouped,
+}
+
+PERSISTENCE_MODES = ('legacy', Event.GIFTS, Event.COMPACT)
+
+
+def measure(func) -> dict:
+    """Run func twice: once for wall time and queries, once for memory.
+
+    tracemalloc slows Python down a lot, so the timed run is done without it.
+    """
+    queries = QueryCounter()
+    with connection.execute_wrapper(queries):
+        began = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - began
+
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {"seconds": elapsed, "peak_bytes": peak, "queries": queries.count}
+
+
+class Command(BaseCommand):
+    """Django command to benchmark matching and Gift persistence.
+
+    Pure matching is measured for every size and strategy. Persistence is
+    measured against the configured database inside a transaction which is
+    rolled back at the end, so the database is left untouched.
+    """
+
+    help = "Benchmark the matching strategies and Gift persistence."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default=DEFAULT_SIZES,
+                            help="Comma separated attender counts.")
+        parser.add_argument('--strategies',
+                            default=",".join(MATCHING_STRATEGIES),
+                            help="Comma separated matching strategies.")
+        parser.add_argument('--max-persist', type=int, default=100000,
+                            help="Largest size stored in the database.")
+        parser.add_argument('--max-legacy', type=int, default=10000,
+                            help="Largest size run through the legacy path.")
+        parser.add_argument('--output', help="Write the results as JSON.")
+        parser.add_argument('--baseline',
+                            help="JSON results of an earlier run to compare "
+                                 "against.")
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help="Allowed slowdown against the baseline.")
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(",")]
+        strategies = options['strategies'].split(",")
+        unknown = set(strategies) - set(MATCHING_STRATEGIES)
+        if unknown:
+            raise CommandError(f"Unknown strategies: {sorted(unknown)}")
+
+        results = []
+        for size in sizes:
+            results.extend(self.bench_matching(size, strategies))
+            if size <= options['max_persist']:
+                results.extend(self.bench_persistence(
+                    size, legacy=size <= options['max_legacy']))
+
+        report = {
+            "date": timezone.now().isoformat(),
+            "python": platform.python_version(),
+            "database": connection.vendor,
+            "results": results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+        if options['baseline']:
+            self.compare(results, options['baseline'], options['tolerance'])
+
+    def bench_matching(self, size: int, strategies):
+        attender_ids = list(range(1, size + 1))
+        exclusions = sample_exclusions(attender_ids, random.Random(SEED))
+        results = []
+        for strategy in strategies:
+            match = MATCHING_STRATEGIES[strategy]
+            result = {"phase": "matching", "strategy": strategy,
+                      "size": size}
+            result.update(measure(lambda: match(attender_ids, exclusions)))
+            self.write(result)
+            results.append(result)
+        return results
+
+    def bench_persistence(self, size: int, legacy: bool):
+        results = []
+        with transaction.atomic():
+            event = self.make_event(size)
+            for mode in PERSISTENCE_MODES:
+                if mode == 'legacy' and not legacy:
+                    continue
+                result = {"phase": "persistence", "strategy": mode,
+                          "size": size}
+                result.update(measure(lambda: self.start(event, mode)))
+                self.write(result)
+                results.append(result)
+            transaction.set_rollback(True)
+        return results
+
+    def start(self, event: Event, mode: str):
+        sid = transaction.savepoint()
+        if mode == 'legacy':
+            legacy_match_and_create(event)
+        else:
+            event.pairing_mode = mode
+            match_and_create_gift_for_attenders(event)
+        transaction.savepoint_rollback(sid)
+
+    def make_event(self, size: int) -> Event:
+        User = get_user_model()
+        users = User.objects.bulk_create(
+            (User(username=f"bench-{i}", name="bench") for i in range(size)),
+            batch_size=GIFT_BATCH_SIZE,
+        )
+        event = Event.objects.create(title="benchmark", location="bench",
+                                     moderator=users[0])
+        Through = Event.attenders.through
+        Through.objects.bulk_create(
+            (Through(event_id=event.pk, user_id=user.pk) for user in users),
+            batch_size=GIFT_BATCH_SIZE,
+        )
+        return event
+
+    def write(self, result: dict):
+        self.stdout.write(
+            f"{result['phase']:>11} {result['strategy']:>9} "
+            f"{result['size']:>8}: {result['seconds']:9.3f}s "
+            f"{result['peak_bytes'] / 2 ** 20:9.1f}MiB "
+            f"{result['queries']:>7} queries"
+        )
+
+    def compare(self, results, path: str, tolerance: float):
+        with open(path) as baseline_file:
+            baseline = {
+                (item['phase'], item['strategy'], item['size']): item
+                for item in json.load(baseline_file)['results']
+            }
+        regressions = []
+        for result in results:
+            before = baseline.get(
+                (result['phase'], result['strategy'], result['size']))
+            if before is None:
+                continue
+            for metric in ('seconds', 'peak_bytes', 'queries'):
+                if result[metric] > before[metric] * (1 + tolerance) and \
+                        result[metric] - before[metric] > NOISE_FLOOR[metric]:
+                    regressions.append(
+                        f"{result['phase']} {result['strategy']} "
+                        f"{result['size']}: {metric} "
+                        f"{before[metric]} -> {result[metric]}")
+        if regressions:
+            raise CommandError("Regressions against the baseline:\n" +
+                               "\n".join(regressions))
+        self.stdout.write(self.style.SUCCESS("No regressions."))
@@ -0,0 +1,152 @@
+"""Matching engines deciding which attender buys a gift for which attender.
+
+A matcher takes the attender ids of an event and returns two aligned arrays,
+``givers`` and ``recivers``, so that ``givers[i]`` buys a gift for
+``recivers[i]``. Matchers are plain Python and never touch the database, the
+caller loads the ids and stores the result.
+"""
+import random
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+
+class MatchingInfeasible(Exception):
+    """Raised when no assignment satisfies the exclusion rules."""
+
+
+class CycleMatcher:
+    """Shuffle the attenders and close them into a single gift cycle."""
+
+    def __init__(self, seed=None):
+        self.seed = seed
+        self.rng = random.Random(seed)
+
+    def match(self, attender_ids, exclusions=()):
+        givers = array('q', attender_ids)
+        self.rng.shuffle(givers)
+        recivers = givers[1:] + givers[:1]
+        return givers, recivers
+
+
+class ExclusionMatcher(CycleMatcher):
+    """Find a derangement which respects "giver must not give to reciver".
+
+    The shuffled cycle is used as a starting matching between givers and
+    recivers, the givers whose cycle successor is excluded are unmatched and
+    then re-matched one by one through augmenting paths. The bipartite graph
+    is the complete one minus the exclusions, so the breadth first search
+    keeps the not yet visited recivers in one list and only rescans the few
+    excluded ones; every augmentation is O(attenders + exclusions).
+
+    If a giver can not be re-matched, no perfect matching exists at all and
+    MatchingInfeasible is raised, so infeasible events fail in bounded time
+    instead of being retried.
+    """
+
+    def match(self, attender_ids, exclusions=()):
+        givers, recivers = super().match(attender_ids)
+        count = len(givers)
+        position = {uid: i for i, uid in enumerate(givers)}
+
+        forbidden = {}
+        for giver, reciver in exclusions:
+            if giver == reciver:
+                continue
+            giver, reciver = position.get(giver), position.get(reciver)
+            if giver is not None and reciver is not None:
+                forbidden.setdefault(giver, set()).add(reciver)
+        if not forbidden:
+            return givers, recivers
+
+        # Work on positions in the shuffled order; reciver j is givers[j].
+        match_giver = [(i + 1) % count for i in range(count)]
+        match_reciver = [(j - 1) % count for j in range(count)]
+        free_givers = []
+        for giver, excluded in forbidden.items():
+            if match_giver[giver] in excluded:
+                match_reciver[match_giver[giver]] = -1
+                match_giver[giver] = -1
+                free_givers.append(giver)
+        self.rng.shuffle(free_givers)
+
+        order = list(range(count))
+        for giver in free_givers:
+            self.rng.shuffle(order)
+            self._augment(giver, order, forbidden, match_giver, match_reciver)
+
+        return givers, array('q', (givers[j] for j in match_giver))
+
+    def _augment(self, root, order, forbidden, match_giver, match_reciver):
+        """Match root through a shortest augmenting path."""
+        unvisited = order[:]
+        parent = {}
+        queue = [root]
+        for giver in queue:
+            excluded = forbidden.get(giver, ())
+            remaining = []
+            for reciver in unvisited:
+                if reciver == giver or reciver in excluded:
+                    remaining.append(reciver)
+                    continue
+                parent[reciver] = giver
+                if match_reciver[reciver] == -1:
+                    self._flip(reciver, parent, match_giver, match_reciver)
+                    return
+                queue.append(match_reciver[reciver])
+            unvisited = remaining
+
+        raise MatchingInfeasible(
+            "There is no assignment which respects the exclusion rules.")
+
+    @staticmethod
+    def _flip(reciver, parent, match_giver, match_reciver):
+        while reciver != -1:
+            giver = parent[reciver]
+            previous = match_giver[giver]
+            match_giver[giver] = reciver
+            match_reciver[reciver] = giver
+            reciver = previous
+
+
+def _match_group(task):
+    matcher_class, seed, attender_ids, exclusions = task
+    return matcher_class(seed).match(attender_ids, exclusions)
+
+
+def match_in_groups(matcher_class, seed, groups, exclusions=(),
+                    max_workers=1):
+    """Match every group of attender ids independently.
+
+    Only the exclusions inside a group are given to its matcher. With more
+    than one worker the groups are matched concurrently in a process pool;
+    workers only need this module, so they are spawned without Django.
+    """
+    group_of = {}
+    for index, group in enumerate(groups):
+        for uid in group:
+            group_of[uid] = index
+    group_exclusions = [[] for _ in groups]
+    for giver, reciver in exclusions:
+        index = group_of.get(giver)
+        if index is not None and group_of.get(reciver) == index:
+            group_exclusions[index].append((giver, reciver))
+
+    rng = random.Random(seed)
+    tasks = [
+        (matcher_class, rng.getrandbits(64), group, group_exclusions[i])
+        for i, group in enumerate(groups)
+    ]
+    if max_workers == 1 or len(tasks) < 2:
+        results = map(_match_group, tasks)
+    else:
+        pool = ProcessPoolExecutor(max_workers=max_workers,
+                                   mp_context=get_context('spawn'))
+        with pool:
+            results = list(pool.map(_match_group, tasks))
+
+    givers, recivers = array('q'), array('q')
+    for group_givers, group_recivers in results:
+        givers.extend(group_givers)
+        recivers.extend(group_recivers)
+    return givers, recivers
@@ -0,0 +1,14 @@
+from rest_framework.pagination import CursorPagination
+
+
+class EventCursorPagination(CursorPagination):
+    """Newest first pages of events.
+
+    The cursor keeps the position in (date_created, id), so fetching a page
+    costs the same however deep the client scrolls, and events created in
+    the meantime do not shift the following pages.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-date_created', '-id')
@@ -0,0 +1,117 @@
+"""Compact storage of a whole matching in a single Event row.
+
+The pairing is packed as little endian 64 bit integers: first every giver
+id in ascending order, then the reciver of each giver at the same position.
+Looking up a reciver is a binary search over the giver half of the buffer,
+nothing is decoded or copied.
+"""
+import sys
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from threading import Lock
+
+from django.conf import settings
+
+from core.models import Event
+
+
+PAIRING_CACHE_BYTES = 32 * 1024 * 1024
+
+
+class PackedPairing:
+
+    def __init__(self, blob):
+        values = memoryview(bytes(blob)).cast('q')
+        if sys.byteorder == 'big':
+            swapped = array('q', values)
+            swapped.byteswap()
+            values = memoryview(swapped)
+        self.count = len(values) // 2
+        self.nbytes = values.nbytes
+        self.givers = values[:self.count]
+        self.recivers = values[self.count:]
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        return zip(self.givers, self.recivers)
+
+    def reciver_of(self, giver: int):
+        """Return the reciver of giver, or None if giver is not matched."""
+        position = bisect_left(self.givers, giver)
+        if position < self.count and self.givers[position] == giver:
+            return self.recivers[position]
+        return None
+
+
+def pack_pairing(givers, recivers) -> bytes:
+    pairs = sorted(zip(givers, recivers))
+    values = array('q', (giver for giver, _ in pairs))
+    values.extend(reciver for _, reciver in pairs)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values.tobytes()
+
+
+class PairingCache:
+    """Least recently used pairings, holding at most max_bytes of them.
+
+    Only the latest version of an event is kept, and pairings larger than
+    the whole cache are not kept at all.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.entries = OrderedDict()
+        self.nbytes = 0
+
+    def get(self, event_id: int, version):
+        with self.lock:
+            entry = self.entries.get(event_id)
+            if entry is None or entry[0] != version:
+                return None
+            self.entries.move_to_end(event_id)
+            return entry[1]
+
+    def set(self, event_id: int, version, pairing: PackedPairing,
+            max_bytes: int):
+        with self.lock:
+            self.discard(event_id)
+            if pairing.nbytes > max_bytes:
+                return
+            self.entries[event_id] = (version, pairing)
+            self.nbytes += pairing.nbytes
+            while self.nbytes > max_bytes:
+                self.discard(next(iter(self.entries)))
+
+    def discard(self, event_id: int):
+        entry = self.entries.pop(event_id, None)
+        if entry is not None:
+            self.nbytes -= entry[1].nbytes
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.nbytes = 0
+
+
+_pairings = PairingCache()
+
+
+def get_pairing(event: Event) -> PackedPairing:
+    """Return the packed pairing of a compact event.
+
+    Decoded pairings are kept per process and keyed by date_updated, so the
+    blob is only read again after the event changed. The cache holds at
+    most SECRETSANTA_PAIRING_CACHE_BYTES of them.
+    """
+    pairing = _pairings.get(event.pk, event.date_updated)
+    if pairing is None:
+        blob = Event.objects.filter(pk=event.pk)\
+                            .values_list('pairing', flat=True).get()
+        pairing = PackedPairing(blob or b'')
+        _pairings.set(event.pk, event.date_updated, pairing, getattr(
+            settings, 'SECRETSANTA_PAIRING_CACHE_BYTES', PAIRING_CACHE_BYTES))
+    return pairing
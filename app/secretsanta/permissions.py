@@ -1,10 +1,29 @@
 from rest_framework.permissions import BasePermission
 
 
+def is_event_attender(request, event) -> bool:
+    """Return whether the user of request attends event.
+
+    Events loaded through a queryset filtered by attender carry a true
+    viewer_is_attender annotation and need no query at all. Otherwise the
+    membership is checked with an EXISTS query on the attenders table and
+    memoized for the rest of the request.
+    """
+    if getattr(event, 'viewer_is_attender', False):
+        return True
+
+    memo = getattr(request, '_event_membership', None)
+    if memo is None:
+        memo = request._event_membership = {}
+    if event.pk not in memo:
+        memo[event.pk] = event.attenders.filter(pk=request.user.pk).exists()
+    return memo[event.pk]
+
+
 class IsEventModerator(BasePermission):
 
     def has_object_permission(self, request, view, obj):
-        if request.user == obj.moderator:
+        if obj.moderator_id == request.user.pk:
             return True
 
         return False
@@ -13,19 +32,17 @@ class IsEventModerator(BasePermission):
 class IsEventAttender(BasePermission):
 
     def has_object_permission(self, request, view, obj):
-        attenders = obj.attenders.all()
-        return True if request.user in attenders else False
+        return is_event_attender(request, obj)
 
 
 class EventPermission(BasePermission):
 
     def has_object_permission(self, request, view, obj):
         if view.action in ['list', 'retrieve']:
-            attenders = obj.attenders.all()
-            return True if request.user in attenders else False
+            return is_event_attender(request, obj)
 
         if view.action in ['create', 'update', 'partial_update', 'destroy',
                            'upload_image']:
-            return request.user == obj.moderator
+            return obj.moderator_id == request.user.pk
 
         return False
@@ -1,13 +1,21 @@
+import codecs
+import csv
+
 from django.contrib.auth import get_user_model
 
 from rest_framework import serializers
 
-from core.models import Event, Gift
+from account.serializers import UserSerializers
+
+from core.models import Event, Gift, StartJob
+
+from secretsanta.fields import BulkPrimaryKeyRelatedField
+from secretsanta.jobs import job_progress
 
 
 class EventSerializer(serializers.ModelSerializer):
 
-    attenders = serializers.PrimaryKeyRelatedField(
+    attenders = BulkPrimaryKeyRelatedField(
         many=True,
         queryset=get_user_model().objects.all(),
     )
@@ -17,22 +25,121 @@ class EventSerializer(serializers.ModelSerializer):
         fields = (
             'id', 'title', 'description',
             'location', 'moderator', 'attenders',
-            'date_created', 'date_updated', 'image'
+            'date_created', 'date_updated', 'image',
+            'previous_event', 'history_depth', 'pairing_mode',
+            'allow_late_join', 'group_size'
         )
         read_only_fields = ('id', 'moderator', 'image')
 
+    def validate_previous_event(self, value):
+        request = self.context.get('request')
+        if value is not None and request is not None and \
+                not value.attenders.filter(pk=request.user.pk).exists():
+            raise serializers.ValidationError(
+                "You can only link events which you attend.")
+        return value
+
+    def validate_pairing_mode(self, value):
+        if self.instance is not None and self.instance.is_start and \
+                value != self.instance.pairing_mode:
+            raise serializers.ValidationError(
+                "Pairing mode can not change after the event started.")
+        return value
+
+
+class EventSummarySerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = Event
+        fields = ('id', 'title', 'description', 'location', 'image')
+        read_only_fields = fields
+
 
 class GiftSerializer(serializers.ModelSerializer):
+    """Gift with raw ids, optionally embedding the reciver and the event.
+
+    The embedded objects are only added for the relations named in expand,
+    and are read from the related instances, so the caller has to load them
+    along with the gifts.
+    """
+    EXPANDABLE = ('reciver', 'event')
+
+    reciver_detail = UserSerializers(source='reciver', read_only=True)
+    event_detail = EventSummarySerializer(source='event', read_only=True)
 
     class Meta:
         model = Gift
         fields = "__all__"
 
+    def __init__(self, *args, expand=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        for name in self.EXPANDABLE:
+            if name not in expand:
+                self.fields.pop(f'{name}_detail')
+
+
+class StartJobSerializer(serializers.ModelSerializer):
+    processed = serializers.SerializerMethodField()
+
+    class Meta:
+        model = StartJob
+        fields = (
+            'id', 'event', 'status', 'total', 'processed', 'message',
+            'date_created', 'date_updated'
+        )
+        read_only_fields = fields
+
+    def get_processed(self, job) -> int:
+        return job_progress(job)
+
 
 class AddAttenderSerializer(serializers.Serializer):
     username = serializers.CharField(max_length=255, allow_blank=False)
 
 
+class AddAttendersSerializer(serializers.Serializer):
+    """Usernames given as a list or as the first column of a CSV file."""
+
+    usernames = serializers.ListField(
+        child=serializers.CharField(max_length=255, allow_blank=False),
+        required=False,
+    )
+    file = serializers.FileField(required=False, write_only=True)
+
+    def validate(self, attrs):
+        if ('usernames' in attrs) == ('file' in attrs):
+            raise serializers.ValidationError(
+                "Send either a list of usernames or a CSV file.")
+        return attrs
+
+    def get_usernames(self):
+        """Yield the given usernames, reading a CSV file line by line.
+
+        The file is only decoded while it is read, so a file which is no
+        UTF-8 encoded CSV raises a ValidationError from the iteration.
+        """
+        if 'usernames' in self.validated_data:
+            yield from self.validated_data['usernames']
+            return
+        rows = csv.reader(codecs.iterdecode(self.validated_data['file'],
+                                            'utf-8-sig'))
+        try:
+            for number, row in enumerate(rows):
+                name = row[0].strip() if row else ""
+                if not name or (number == 0 and name.lower() == "username"):
+                    continue
+                yield name
+        except (UnicodeDecodeError, csv.Error):
+            raise serializers.ValidationError(
+                {'file': ["Upload a UTF-8 encoded CSV file."]})
+
+
+class AddExclusionSerializer(serializers.Serializer):
+    giver = serializers.CharField(max_length=255, allow_blank=False)
+    reciver = serializers.CharField(max_length=255, allow_blank=False)
+    mutual = serializers.BooleanField(default=False)
+
+
 class EventImageSerializer(serializers.ModelSerializer):
     """Serializer for uploading images to recipes."""
 
@@ -0,0 +1,346 @@
+"""Add or remove one attender of an event without matching everybody again.
+
+Joining a started event splices the newcomer into the existing matching:
+one gift ``giver -> reciver`` becomes ``giver -> newcomer -> reciver``.
+Leaving closes the gap the other way round. Both touch O(1) Gift rows (or
+rewrite the single packed row of a compact event).
+"""
+import random
+from itertools import chain, islice
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Max, Min, Q
+
+from core.models import Event, Gift
+
+from secretsanta.matching import MatchingInfeasible
+from secretsanta.pairing import get_pairing
+from secretsanta.utils import locked_events, store_compact_pairing
+
+
+SAMPLE_SIZE = 16
+BULK_JOIN_CHUNK = 5000
+
+ADDED = "added"
+ALREADY_ATTENDING = "already_attending"
+NOT_FOUND = "not_found"
+DUPLICATE = "duplicate"
+NO_PLACE = "no_place"
+
+
+class GiftRows:
+    """Matching of an event stored as Gift rows.
+
+    New recivers and gifts are kept until save, which writes them with one
+    bulk update and one bulk insert; reads see them already.
+    """
+
+    def __init__(self, event: Event):
+        self.event = event
+        self.gifts = Gift.objects.filter(event=event)
+        self.pks = {}
+        self.changed = {}
+        self.added = {}
+
+    def reciver_of(self, giver: int):
+        if giver in self.added:
+            return self.added[giver]
+        if giver in self.changed:
+            return self.changed[giver]
+        return self.gifts.filter(giver_id=giver)\
+                         .values_list('reciver_id', flat=True).first()
+
+    def giver_of(self, reciver: int):
+        for giver, candidate in chain(self.added.items(),
+                                      self.changed.items()):
+            if candidate == reciver:
+                return giver
+        return self.gifts.filter(reciver_id=reciver)\
+                         .exclude(giver_id__in=self.changed)\
+                         .values_list('giver_id', flat=True).first()
+
+    def rows(self, queryset):
+        rows = queryset.values_list('pk', 'giver_id', 'reciver_id')
+        for pk, giver, reciver in rows.iterator():
+            self.pks[giver] = pk
+            yield giver, self.changed.get(giver, reciver)
+
+    def sample(self, size: int = SAMPLE_SIZE):
+        """Yield up to size (giver, reciver) pairs from a random gift on."""
+        bounds = self.gifts.aggregate(low=Min('pk'), high=Max('pk'))
+        if bounds['low'] is None:
+            return
+        pivot = random.randint(bounds['low'], bounds['high'])
+        ordered = self.gifts.order_by('pk')
+        count = 0
+        for pair in self.rows(ordered.filter(pk__gte=pivot)[:size]):
+            count += 1
+            yield pair
+        if count < size:
+            yield from self.rows(ordered.filter(pk__lt=pivot)[:size - count])
+
+    def __iter__(self):
+        yield from self.rows(self.gifts.order_by('pk'))
+        yield from list(self.added.items())
+
+    def set_reciver(self, giver: int, reciver: int):
+        if giver in self.added:
+            self.added[giver] = reciver
+        else:
+            self.changed[giver] = reciver
+
+    def add(self, giver: int, reciver: int):
+        self.added[giver] = reciver
+
+    def remove(self, giver: int):
+        self.changed.pop(giver, None)
+        if self.added.pop(giver, None) is None:
+            self.gifts.filter(giver_id=giver).delete()
+
+    def save(self):
+        known = [Gift(pk=self.pks[giver], reciver_id=reciver)
+                 for giver, reciver in self.changed.items()
+                 if giver in self.pks]
+        if known:
+            Gift.objects.bulk_update(known, ['reciver'])
+        for giver, reciver in self.changed.items():
+            if giver not in self.pks:
+                self.gifts.filter(giver_id=giver).update(reciver_id=reciver)
+        if self.added:
+            Gift.objects.bulk_create(
+                Gift(event_id=self.event.pk, giver_id=giver,
+                     reciver_id=reciver)
+                for giver, reciver in self.added.items())
+        self.changed = {}
+        self.added = {}
+
+
+class PackedRows:
+    """Matching of a compact event, rewritten as one row on save."""
+
+    def __init__(self, event: Event):
+        self.event = event
+        self.pairs = dict(get_pairing(event))
+
+    def reciver_of(self, giver: int):
+        return self.pairs.get(giver)
+
+    def giver_of(self, reciver: int):
+        for giver, candidate in self.pairs.items():
+            if candidate == reciver:
+                return giver
+        return None
+
+    def sample(self, size: int = SAMPLE_SIZE):
+        givers = list(self.pairs)
+        for giver in random.sample(givers, min(size, len(givers))):
+            yield giver, self.pairs[giver]
+
+    def __iter__(self):
+        return iter(list(self.pairs.items()))
+
+    def set_reciver(self, giver: int, reciver: int):
+        self.pairs[giver] = reciver
+
+    def add(self, giver: int, reciver: int):
+        self.pairs[giver] = reciver
+
+    def remove(self, giver: int):
+        del self.pairs[giver]
+
+    def save(self):
+        store_compact_pairing(self.event, self.pairs.keys(),
+                              self.pairs.values(), self.event.pairing_seed)
+
+
+def matching_of(event: Event):
+    if event.pairing_mode == Event.COMPACT:
+        return PackedRows(event)
+    return GiftRows(event)
+
+
+def load_forbidden(event: Event, user_ids):
+    """Return the excluded pairs of event which involve one of user_ids."""
+    return set(event.exclusions.filter(Q(giver__in=user_ids) |
+                                       Q(reciver__in=user_ids))
+                               .values_list('giver_id', 'reciver_id'))
+
+
+def splice_in(event: Event, user_id: int):
+    """Turn a random gift giver -> reciver into giver -> user -> reciver."""
+    if splice_in_many(event, [user_id]):
+        raise MatchingInfeasible(
+            "There is no place for the attender which respects the "
+            "exclusion rules.")
+
+
+def splice_in_many(event: Event, user_ids) -> list:
+    """Splice every user of user_ids in, returning those left without place.
+
+    The matching is sampled, the exclusions loaded and the changes saved
+    once for all of them. Every user tries a few random gifts of the
+    sample, which grows with the gifts the users get, and only scans the
+    whole matching if none of them fits.
+    """
+    pairs = matching_of(event)
+    forbidden = load_forbidden(event, user_ids)
+    pool = dict(pairs.sample(len(user_ids) + SAMPLE_SIZE))
+    givers = list(pool)
+    left_out = []
+    for user_id in user_ids:
+        candidates = ((giver, pool[giver]) for giver in
+                      random.choices(givers, k=SAMPLE_SIZE)) if givers else ()
+        for giver, reciver in chain(candidates, pairs):
+            if (giver, user_id) not in forbidden and \
+                    (user_id, reciver) not in forbidden:
+                break
+        else:
+            left_out.append(user_id)
+            continue
+        pairs.set_reciver(giver, user_id)
+        pairs.add(user_id, reciver)
+        if giver in pool:
+            pool[giver] = user_id
+        pool[user_id] = reciver
+        givers.append(user_id)
+    pairs.save()
+    return left_out
+
+
+def splice_out(event: Event, user_id: int):
+    """Remove user from the matching and close the gap it leaves."""
+    pairs = matching_of(event)
+    reciver = pairs.reciver_of(user_id)
+    giver = pairs.giver_of(user_id)
+    if reciver is None:
+        return
+    pairs.remove(user_id)
+    if giver == user_id:
+        pairs.save()
+        return
+
+    forbidden = load_forbidden(event, [giver, reciver])
+    if giver != reciver and (giver, reciver) not in forbidden:
+        pairs.set_reciver(giver, reciver)
+        pairs.save()
+        return
+
+    # The giver can not take over the reciver, because they are the same
+    # person or it is excluded, so swap recivers with another gift instead.
+    alone = True
+    for other, other_reciver in chain(pairs.sample(), pairs):
+        if other in (giver, user_id):
+            continue
+        alone = False
+        if other != reciver and other_reciver != giver and \
+                (giver, other_reciver) not in forbidden and \
+                (other, reciver) not in forbidden:
+            pairs.set_reciver(giver, other_reciver)
+            pairs.set_reciver(other, reciver)
+            pairs.save()
+            return
+    if alone:
+        pairs.set_reciver(giver, reciver)
+        pairs.save()
+        return
+    raise MatchingInfeasible(
+        "The attender can not leave without breaking the exclusion rules.")
+
+
+def join_event(event: Event, user):
+    """Add user to the attenders, splicing it in if event is started.
+
+    Raises MatchingInfeasible, leaving everything untouched, when the
+    exclusion rules leave no place for the newcomer.
+    """
+    with transaction.atomic():
+        event = locked_events().defer('pairing').get(pk=event.pk)
+        if event.attenders.filter(pk=user.pk).exists():
+            return
+        event.attenders.add(user)
+        if event.is_start:
+            splice_in(event, user.pk)
+        event.save(update_fields=['date_updated'])
+
+
+def leave_event(event: Event, user):
+    """Remove user from the attenders, closing its gap if event is started.
+
+    Raises MatchingInfeasible, leaving everything untouched, when the gap
+    can not be closed without breaking the exclusion rules.
+    """
+    with transaction.atomic():
+        event = locked_events().defer('pairing').get(pk=event.pk)
+        if not event.attenders.filter(pk=user.pk).exists():
+            return
+        if event.is_start:
+            splice_out(event, user.pk)
+        event.attenders.remove(user)
+        event.save(update_fields=['date_updated'])
+
+
+def join_event_in_bulk(event: Event, usernames) -> list:
+    """Add the users named in usernames, reporting what happened to each.
+
+    Returns one ``{"username", "result"}`` entry per given name, in order.
+    Names are handled in chunks of BULK_JOIN_CHUNK; a chunk costs one query
+    resolving the users, one for the attenders among them and one bulk
+    insert of the through rows, so usernames may be a lazy iterable.
+    Newcomers of a started event are spliced in one by one, one for whom the
+    exclusion rules leave no place is left out and reported as such.
+    """
+    report = []
+    seen = set()
+    usernames = iter(usernames)
+    with transaction.atomic():
+        event = locked_events().defer('pairing').get(pk=event.pk)
+        while True:
+            chunk = {}
+            for name in islice(usernames, BULK_JOIN_CHUNK):
+                entry = {"username": name, "result": DUPLICATE}
+                report.append(entry)
+                if name not in seen:
+                    seen.add(name)
+                    chunk[name] = entry
+            if not chunk:
+                break
+            _join_chunk(event, chunk)
+
+        if any(entry["result"] == ADDED for entry in report):
+            event.save(update_fields=['date_updated'])
+    return report
+
+
+def _join_chunk(event: Event, entries: dict):
+    users = dict(get_user_model().objects.filter(username__in=entries)
+                                         .values_list('username', 'pk'))
+    Through = Event.attenders.through
+    attending = set(Through.objects.filter(event_id=event.pk,
+                                           user_id__in=users.values())
+                                   .values_list('user_id', flat=True))
+    newcomers = []
+    for name, entry in entries.items():
+        if name not in users:
+            entry["result"] = NOT_FOUND
+        elif users[name] in attending:
+            entry["result"] = ALREADY_ATTENDING
+        else:
+            entry["result"] = ADDED
+            newcomers.append(name)
+
+    Through.objects.bulk_create(
+        (Through(event_id=event.pk, user_id=users[name])
+         for name in newcomers),
+        ignore_conflicts=True,
+    )
+    if not event.is_start:
+        return
+    left_out = set(splice_in_many(event, [users[name]
+                                          for name in newcomers]))
+    if not left_out:
+        return
+    Through.objects.filter(event_id=event.pk, user_id__in=left_out).delete()
+    for name in newcomers:
+        if users[name] in left_out:
+            entries[name]["result"] = NO_PLACE
@@ -0,0 +1,43 @@
+import json
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from core.models import Event, Gift
+
+
+class BenchmarkMatchingTests(TestCase):
+
+    def test_results_are_written_as_json(self):
+        with tempfile.NamedTemporaryFile(suffix='.json') as output:
+            call_command("benchmark_matching", sizes="10,50",
+                         output=output.name, stdout=StringIO())
+            report = json.load(output)
+
+        keys = {(item['phase'], item['strategy'], item['size'])
+                for item in report['results']}
+        for size in (10, 50):
+            for strategy in ('cycle', 'exclusion', 'grouped'):
+                self.assertIn(("matching", strategy, size), keys)
+            for mode in ('legacy', 'gifts', 'compact'):
+                self.assertIn(("persistence", mode, size), keys)
+        for item in report['results']:
+            self.assertGreaterEqual(item['seconds'], 0)
+            self.assertGreaterEqual(item['peak_bytes'], 0)
+        self.assertFalse(Event.objects.exists())
+        self.assertFalse(Gift.objects.exists())
+
+    def test_regressions_against_baseline_fail(self):
+        baseline = {"results": [{
+            "phase": "persistence", "strategy": "gifts", "size": 10,
+            "seconds": 0, "peak_bytes": 0, "queries": 1,
+        }]}
+        with tempfile.NamedTemporaryFile('w', suffix='.json') as old:
+            json.dump(baseline, old)
+            old.flush()
+            with self.assertRaises(CommandError):
+                call_command("benchmark_matching", sizes="10",
+                             baseline=old.name, stdout=StringIO())
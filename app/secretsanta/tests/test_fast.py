@@ -0,0 +1,83 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core.models import Event
+
+
+EVENT_URL = reverse("santa:event-list")
+MY_GIFTS_URL = reverse("santa:event-my-gifts")
+
+
+@override_settings(SECRETSANTA_START_ASYNC=False)
+class FastSerializationTests(TestCase):
+    """The fast path must render exactly the bytes of the serializers."""
+
+    def setUp(self) -> None:
+        User = get_user_model()
+        self.users = User.objects.bulk_create(
+            User(username=f"user-{i}", name=f"User {i}") for i in range(6))
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.users[0])
+
+        self.first = Event.objects.create(
+            title="First", description="", location="At Cafe",
+            moderator=self.users[0])
+        self.first.attenders.add(*reversed(self.users))
+        self.second = Event.objects.create(
+            title="Second", description="Ünïcode \"quoted\"",
+            location="Home", moderator=self.users[1],
+            previous_event=self.first, history_depth=2, group_size=3,
+            allow_late_join=True, image="uploads/event/picture.jpg")
+        self.second.attenders.add(*self.users[:4])
+        self.compact = Event.objects.create(
+            title="Compact", location="Office", moderator=self.users[0],
+            pairing_mode=Event.COMPACT)
+        self.compact.attenders.add(*self.users[:3])
+        for event in (self.first, self.second, self.compact):
+            self.client.force_authenticate(user=event.moderator)
+            self.client.post(reverse("santa:event-start", args=(event.id, )))
+        self.client.force_authenticate(user=self.users[0])
+
+    def assertSameContent(self, url, params=None):
+        fast = self.client.get(url, params)
+        with override_settings(SECRETSANTA_FAST_SERIALIZERS=False):
+            slow = self.client.get(url, params)
+
+        self.assertEqual(fast.status_code, 200)
+        self.assertEqual(fast.status_code, slow.status_code)
+        self.assertEqual(fast.content, slow.content)
+
+    def test_list(self):
+        self.assertSameContent(EVENT_URL)
+        self.assertSameContent(EVENT_URL, {"page_size": 1})
+
+    def test_retrieve(self):
+        for event in (self.first, self.second, self.compact):
+            self.assertSameContent(
+                reverse("santa:event-detail", args=(event.id, )))
+
+    def test_retrieve_streams_large_attender_lists(self):
+        url = reverse("santa:event-detail", args=(self.first.id, ))
+        whole = self.client.get(url)
+
+        with override_settings(SECRETSANTA_STREAM_ATTENDERS=3):
+            streamed = self.client.get(url)
+
+        self.assertFalse(whole.streaming)
+        self.assertTrue(streamed.streaming)
+        self.assertEqual(streamed['Content-Type'], whole['Content-Type'])
+        self.assertEqual(streamed['ETag'], whole['ETag'])
+        self.assertEqual(b"".join(streamed.streaming_content), whole.content)
+
+    def test_gift(self):
+        for event in (self.first, self.second, self.compact):
+            url = reverse("santa:event-gift", args=(event.id, ))
+            self.assertSameContent(url)
+            self.assertSameContent(url, {"expand": "reciver,event"})
+
+    def test_my_gifts(self):
+        self.assertSameContent(MY_GIFTS_URL)
+        self.assertSameContent(MY_GIFTS_URL, {"expand": "event,reciver"})
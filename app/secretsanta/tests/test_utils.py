@@ -0,0 +1,405 @@
+from django.test import RequestFactory, TestCase
+from django.contrib.auth import get_user_model
+
+from core.models import Event, Gift, Exclusion
+
+from secretsanta import utils
+from secretsanta.splice import join_event, leave_event
+from secretsanta.matching import (
+    ExclusionMatcher,
+    MatchingInfeasible,
+    match_in_groups
+)
+from secretsanta.pairing import (
+    PackedPairing,
+    PairingCache,
+    get_pairing,
+    pack_pairing
+)
+from secretsanta.permissions import is_event_attender
+
+
+def sample_users(count: int):
+    User = get_user_model()
+    return User.objects.bulk_create(
+        User(username=f"user-{i}", name=f"User {i}") for i in range(count)
+    )
+
+
+def sample_event(attenders) -> Event:
+    event = Event.objects.create(title="This is Title",
+                                 location="At Cafe",
+                                 moderator=attenders[0])
+    event.attenders.add(*attenders)
+    return event
+
+
+class MatchAndCreateGiftTests(TestCase):
+
+    def test_gifts_form_a_single_cycle(self):
+        users = sample_users(25)
+        event = sample_event(users)
+
+        utils.match_and_create_gift_for_attenders(event, batch_size=7)
+
+        pairs = dict(Gift.objects.filter(event=event)
+                                 .values_list('giver_id', 'reciver_id'))
+        self.assertEqual(set(pairs), {user.id for user in users})
+        self.assertEqual(set(pairs.values()), {user.id for user in users})
+
+        giver, visited = users[0].id, set()
+        while giver not in visited:
+            visited.add(giver)
+            giver = pairs[giver]
+        self.assertEqual(len(visited), len(users))
+
+    def test_gifts_are_inserted_in_batches(self):
+        event = sample_event(sample_users(25))
+
+        # attenders, exclusions, four batches, and two savepoints
+        with self.assertNumQueries(8):
+            utils.match_and_create_gift_for_attenders(event, batch_size=7)
+
+        self.assertEqual(Gift.objects.filter(event=event).count(), 25)
+
+    def test_exclusions_are_respected(self):
+        users = sample_users(30)
+        event = sample_event(users)
+        excluded = {(giver.id, reciver.id)
+                    for giver in users[10:] for reciver in users[:10]}
+        Exclusion.objects.bulk_create(
+            Exclusion(event=event, giver_id=giver, reciver_id=reciver)
+            for giver, reciver in excluded
+        )
+
+        utils.match_and_create_gift_for_attenders(event)
+
+        pairs = set(Gift.objects.filter(event=event)
+                                .values_list('giver_id', 'reciver_id'))
+        self.assertEqual(len(pairs), 30)
+        self.assertEqual({reciver for _, reciver in pairs},
+                         {user.id for user in users})
+        for giver, reciver in pairs:
+            self.assertNotEqual(giver, reciver)
+            self.assertNotIn((giver, reciver), excluded)
+
+    def test_infeasible_exclusions_create_nothing(self):
+        users = sample_users(3)
+        event = sample_event(users)
+        Exclusion.objects.create(event=event, giver=users[0],
+                                 reciver=users[1])
+        Exclusion.objects.create(event=event, giver=users[0],
+                                 reciver=users[2])
+
+        with self.assertRaises(MatchingInfeasible):
+            utils.match_and_create_gift_for_attenders(event)
+
+        self.assertFalse(Gift.objects.filter(event=event).exists())
+
+
+class CompactPairingTests(TestCase):
+
+    def test_compact_event_stores_no_gift_rows(self):
+        users = sample_users(40)
+        event = sample_event(users)
+        event.pairing_mode = Event.COMPACT
+        event.save()
+
+        utils.match_and_create_gift_for_attenders(event)
+        event.refresh_from_db()
+
+        self.assertFalse(Gift.objects.filter(event=event).exists())
+        self.assertIsNotNone(event.pairing_seed)
+        pairing = get_pairing(event)
+        self.assertEqual(len(pairing), 40)
+        recivers = {pairing.reciver_of(user.id) for user in users}
+        self.assertEqual(recivers, {user.id for user in users})
+        self.assertIsNone(pairing.reciver_of(0))
+
+    def test_pack_pairing_round_trip(self):
+        givers, recivers = [5, 3, 9, 1], [3, 9, 1, 5]
+
+        pairing = PackedPairing(pack_pairing(givers, recivers))
+
+        self.assertEqual(sorted(pairing), sorted(zip(givers, recivers)))
+        for giver, reciver in zip(givers, recivers):
+            self.assertEqual(pairing.reciver_of(giver), reciver)
+
+    def test_pairing_cache_is_bounded_by_bytes(self):
+        cache = PairingCache()
+        pairing = PackedPairing(pack_pairing(range(10), range(1, 11)))
+
+        cache.set(1, "v1", pairing, max_bytes=400)
+        cache.set(1, "v2", pairing, max_bytes=400)
+        self.assertIsNone(cache.get(1, "v1"))
+        self.assertIs(cache.get(1, "v2"), pairing)
+        self.assertEqual(cache.nbytes, 160)
+
+        cache.set(2, "v1", pairing, max_bytes=400)
+        cache.get(1, "v2")
+        cache.set(3, "v1", pairing, max_bytes=400)
+        self.assertIsNone(cache.get(2, "v1"))
+        self.assertEqual(sorted(cache.entries), [1, 3])
+
+        cache.set(4, "v1", pairing, max_bytes=100)
+        self.assertIsNone(cache.get(4, "v1"))
+
+    def test_compact_events_are_part_of_the_history(self):
+        a, b, c = sample_users(3)
+        last_year = sample_event([a, b, c])
+        last_year.pairing_mode = Event.COMPACT
+        last_year.pairing = pack_pairing([a.id, b.id, c.id],
+                                         [b.id, c.id, a.id])
+        last_year.save()
+        event = sample_event([a, b, c])
+        event.previous_event = last_year
+        event.history_depth = 1
+
+        self.assertEqual(utils.load_pair_history(event),
+                         {(a.id, b.id), (b.id, c.id), (c.id, a.id)})
+
+
+class PairHistoryTests(TestCase):
+
+    def setUp(self) -> None:
+        self.users = sample_users(3)
+        self.last_year = sample_event(self.users)
+        a, b, c = self.users
+        Gift.objects.bulk_create([
+            Gift(event=self.last_year, giver=a, reciver=b),
+            Gift(event=self.last_year, giver=b, reciver=c),
+            Gift(event=self.last_year, giver=c, reciver=a),
+        ])
+
+    def test_pairs_of_linked_events_are_avoided(self):
+        event = sample_event(self.users)
+        event.previous_event = self.last_year
+        event.history_depth = 1
+        event.save()
+
+        utils.match_and_create_gift_for_attenders(event)
+
+        a, b, c = (user.id for user in self.users)
+        pairs = set(Gift.objects.filter(event=event)
+                                .values_list('giver_id', 'reciver_id'))
+        self.assertEqual(pairs, {(a, c), (c, b), (b, a)})
+
+    def test_history_is_dropped_when_infeasible(self):
+        users = self.users[:2]
+        event = sample_event(users)
+        event.previous_event = sample_event(users)
+        event.history_depth = 5
+        event.save()
+        a, b = users
+        Gift.objects.bulk_create([
+            Gift(event=event.previous_event, giver=a, reciver=b),
+            Gift(event=event.previous_event, giver=b, reciver=a),
+        ])
+
+        utils.match_and_create_gift_for_attenders(event)
+
+        self.assertEqual(Gift.objects.filter(event=event).count(), 2)
+
+    def test_history_depth_limits_linked_events(self):
+        second = sample_event(self.users)
+        second.previous_event = self.last_year
+        second.save()
+        third = sample_event(self.users)
+        third.previous_event = second
+
+        self.assertEqual(utils.linked_event_ids(third, 1), [second.id])
+        self.assertEqual(utils.linked_event_ids(third, 5),
+                         [second.id, self.last_year.id])
+
+
+class SpliceTests(TestCase):
+
+    def start(self, users, **params):
+        event = sample_event(users)
+        for name, value in params.items():
+            setattr(event, name, value)
+        event.save()
+        utils.match_and_create_gift_for_attenders(event)
+        event.is_start = True
+        event.save()
+        return event
+
+    def pairs_of(self, event):
+        event.refresh_from_db()
+        if event.pairing_mode == Event.COMPACT:
+            return dict(get_pairing(event))
+        return dict(Gift.objects.filter(event=event)
+                                .values_list('giver_id', 'reciver_id'))
+
+    def assertValidMatching(self, event):
+        pairs = self.pairs_of(event)
+        attenders = set(event.attenders.values_list('pk', flat=True))
+        self.assertEqual(set(pairs), attenders)
+        self.assertEqual(set(pairs.values()), attenders)
+        for giver, reciver in pairs.items():
+            self.assertNotEqual(giver, reciver)
+
+    def test_join_started_event_changes_one_gift(self):
+        users = sample_users(11)
+        event = self.start(users[:10])
+        before = self.pairs_of(event)
+
+        join_event(event, users[10])
+
+        after = self.pairs_of(event)
+        self.assertValidMatching(event)
+        changed = {giver for giver in before if before[giver] != after[giver]}
+        self.assertEqual(len(changed), 1)
+        self.assertEqual(after[changed.pop()], users[10].id)
+
+    def test_join_respects_exclusions(self):
+        users = sample_users(6)
+        event = self.start(users[:5])
+        Exclusion.objects.bulk_create(
+            Exclusion(event=event, giver=user, reciver=users[5])
+            for user in users[:4]
+        )
+
+        join_event(event, users[5])
+
+        self.assertEqual(self.pairs_of(event)[users[4].id], users[5].id)
+
+    def test_leave_started_event(self):
+        users = sample_users(10)
+        event = self.start(users)
+
+        leave_event(event, users[3])
+
+        self.assertValidMatching(event)
+        self.assertNotIn(users[3].id, self.pairs_of(event))
+
+    def test_leave_two_person_cycle(self):
+        users = sample_users(4)
+        event = self.start(users[:2])
+        join_event(event, users[2])
+        join_event(event, users[3])
+        a, b = users[:2]
+        Gift.objects.filter(event=event).delete()
+        Gift.objects.bulk_create([
+            Gift(event=event, giver=a, reciver=b),
+            Gift(event=event, giver=b, reciver=a),
+            Gift(event=event, giver=users[2], reciver=users[3]),
+            Gift(event=event, giver=users[3], reciver=users[2]),
+        ])
+
+        leave_event(event, a)
+
+        self.assertValidMatching(event)
+
+    def test_join_and_leave_compact_event(self):
+        users = sample_users(8)
+        event = self.start(users[:7], pairing_mode=Event.COMPACT)
+
+        join_event(event, users[7])
+        self.assertValidMatching(event)
+        leave_event(event, users[0])
+        self.assertValidMatching(event)
+        self.assertFalse(Gift.objects.filter(event=event).exists())
+
+
+class GroupMatchingTests(TestCase):
+
+    def test_random_groups_are_matched_independently(self):
+        users = sample_users(23)
+        event = sample_event(users)
+        event.group_size = 5
+        event.save()
+
+        utils.match_and_create_gift_for_attenders(event)
+
+        pairs = dict(Gift.objects.filter(event=event)
+                                 .values_list('giver_id', 'reciver_id'))
+        self.assertEqual(set(pairs.values()), {user.id for user in users})
+        cycles = []
+        remaining = set(pairs)
+        while remaining:
+            giver, cycle = remaining.pop(), 1
+            while pairs[giver] in remaining:
+                giver = pairs[giver]
+                remaining.remove(giver)
+                cycle += 1
+            cycles.append(cycle)
+        self.assertEqual(sorted(cycles), [3, 5, 5, 5, 5])
+
+    def test_infeasible_random_split_is_reshuffled(self):
+        users = sample_users(4)
+        event = sample_event(users)
+        event.group_size = 2
+        event.save()
+        Exclusion.objects.create(event=event, giver=users[0],
+                                 reciver=users[1])
+        Exclusion.objects.create(event=event, giver=users[1],
+                                 reciver=users[0])
+
+        for seed in range(40):
+            Gift.objects.filter(event=event).delete()
+            utils.match_and_create_gift_for_attenders(
+                event, matcher=ExclusionMatcher(seed))
+
+            pairs = set(Gift.objects.filter(event=event)
+                                    .values_list('giver_id', 'reciver_id'))
+            self.assertEqual(len(pairs), 4)
+            self.assertNotIn((users[0].id, users[1].id), pairs)
+            self.assertNotIn((users[1].id, users[0].id), pairs)
+
+    def test_groups_in_process_pool(self):
+        groups = [list(range(i, i + 50)) for i in range(0, 200, 50)]
+        exclusions = [(i, i + 1) for i in range(199)]
+
+        givers, recivers = match_in_groups(ExclusionMatcher, 3, groups,
+                                           exclusions, max_workers=2)
+
+        self.assertEqual(sorted(givers), list(range(200)))
+        self.assertEqual(sorted(recivers), list(range(200)))
+        for giver, reciver in zip(givers, recivers):
+            self.assertEqual(giver // 50, reciver // 50)
+            self.assertNotEqual(giver, reciver)
+            self.assertNotEqual(giver + 1, reciver)
+
+
+class ExclusionMatcherTests(TestCase):
+
+    def test_match_is_a_derangement_without_excluded_pairs(self):
+        ids = list(range(1, 2001))
+        exclusions = {(i, i % 2000 + 1) for i in ids}
+        exclusions |= {(i, (i + 7) % 2000 + 1) for i in ids}
+
+        givers, recivers = ExclusionMatcher(seed=42).match(ids, exclusions)
+
+        self.assertEqual(sorted(givers), ids)
+        self.assertEqual(sorted(recivers), ids)
+        for giver, reciver in zip(givers, recivers):
+            self.assertNotEqual(giver, reciver)
+            self.assertNotIn((giver, reciver), exclusions)
+
+    def test_same_seed_gives_same_match(self):
+        ids = list(range(100))
+        exclusions = [(i, i + 1) for i in range(99)]
+
+        first = ExclusionMatcher(seed=7).match(ids, exclusions)
+        second = ExclusionMatcher(seed=7).match(ids, exclusions)
+
+        self.assertEqual(first, second)
+
+
+class MembershipTests(TestCase):
+
+    def test_membership_is_memoized_per_request(self):
+        users = sample_users(3)
+        event = sample_event(users[:2])
+        request = RequestFactory().get("/")
+        request.user = users[0]
+        outsider = RequestFactory().get("/")
+        outsider.user = users[2]
+
+        with self.assertNumQueries(1):
+            self.assertTrue(is_event_attender(request, event))
+            self.assertTrue(is_event_attender(request, event))
+        with self.assertNumQueries(1):
+            self.assertFalse(is_event_attender(outsider, event))
+            self.assertFalse(is_event_attender(outsider, event))
@@ -1,21 +1,32 @@
 import tempfile
+import threading
 import os
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+from unittest import skipUnless
+from unittest.mock import patch
 
 from PIL import Image
 
-from django.test import TestCase
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, connections
+from django.test import TestCase, TransactionTestCase, override_settings
 from django.urls import reverse
+from django.utils import timezone
 from django.contrib.auth import get_user_model
 
 from rest_framework.test import APIClient
 from rest_framework import status
 
-from core.models import Event, Gift
+from core.models import Event, Gift, Exclusion, StartJob
 
-from secretsanta import serializers
+from secretsanta import jobs, serializers, utils
+from secretsanta.jobs import run_start_job
+from secretsanta.splice import join_event
 
 
 EVENT_URL = reverse("santa:event-list")
+MY_GIFTS_URL = reverse("santa:event-my-gifts")
 
 
 def make_detail_event_url(event_id):
@@ -26,6 +37,10 @@ def make_start_event_url(event_id):
     return reverse("santa:event-start", args=(event_id, ))
 
 
+def make_start_job_url(job_id):
+    return reverse("santa:start-job-detail", args=(job_id, ))
+
+
 def make_upload_image_url(event_id):
     return reverse("santa:event-upload-image", args=[event_id])
 
@@ -70,6 +85,14 @@ def make_add_attender_url(event_id):
     return reverse("santa:event-add-attender", args=(event_id, ))
 
 
+def make_add_attenders_url(event_id):
+    return reverse("santa:event-add-attenders", args=(event_id, ))
+
+
+def make_add_exclusion_url(event_id):
+    return reverse("santa:event-add-exclusion", args=(event_id, ))
+
+
 class PublicTests(TestCase):
 
     def setUp(self) -> None:
@@ -81,6 +104,7 @@ class PublicTests(TestCase):
         self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
 
 
+@override_settings(SECRETSANTA_START_ASYNC=False)
 class PrivateTests(TestCase):
 
     def setUp(self) -> None:
@@ -103,11 +127,11 @@ class PrivateTests(TestCase):
         sample_event(moderator=self.user1)
 
         res = self.client.get(EVENT_URL)
-        events = Event.objects.all().order_by('-date_created')
+        events = Event.objects.all().order_by('-date_created', '-id')
         serializer = serializers.EventSerializer(events, many=True)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_list_events_limited_user(self):
         sample_event(moderator=self.user1)
@@ -117,12 +141,43 @@ class PrivateTests(TestCase):
         res = self.client.get(EVENT_URL)
 
         events = Event.objects.filter(attenders=self.user1).order_by(
-                                                            '-date_created')
+                                                    '-date_created', '-id')
         serializer = serializers.EventSerializer(events, many=True)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(res.data), 2)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(len(res.data['results']), 2)
+        self.assertEqual(res.data['results'], serializer.data)
+
+    def test_list_events_pages(self):
+        events = [sample_event(moderator=self.user1) for _ in range(5)]
+
+        res = self.client.get(EVENT_URL, {"page_size": 2})
+        ids = [event['id'] for event in res.data['results']]
+        while res.data['next']:
+            sample_event(moderator=self.user1)
+            res = self.client.get(res.data['next'])
+            ids.extend(event['id'] for event in res.data['results'])
+
+        self.assertEqual(ids, [event.id for event in reversed(events)])
+
+    def test_list_events_query_budget(self):
+        for _ in range(5):
+            event = sample_event(moderator=self.user1)
+            event.attenders.add(self.user2)
+
+        # the events and one prefetch of all their attenders
+        with self.assertNumQueries(2):
+            res = self.client.get(EVENT_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_get_gift_query_budget(self):
+        event = start_event_help_func(self.user1, self.user2, self.client)
+        url = make_get_event_gift_for_current_user_url(event.id)
+
+        # the event and the gift
+        with self.assertNumQueries(2):
+            res = self.client.get(url)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
 
     def test_retrieve_event_detail(self):
         event = sample_event(moderator=self.user1)
@@ -135,6 +190,47 @@ class PrivateTests(TestCase):
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         self.assertEqual(res.data, serializer.data)
 
+    def test_retrieve_checks_membership_without_loading_attenders(self):
+        event = sample_event(moderator=self.user1)
+        event.attenders.add(self.user2)
+        url = make_detail_event_url(event.id)
+
+        # the event itself and its attender ids for the response
+        with self.assertNumQueries(2):
+            res = self.client.get(url)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_retrieve_event_not_modified(self):
+        event = sample_event(moderator=self.user1)
+        url = make_detail_event_url(event.id)
+        etag = self.client.get(url)['ETag']
+
+        # only the date_updated of the event
+        with self.assertNumQueries(1):
+            res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res['ETag'], etag)
+
+        event.attenders.add(self.user2)
+        event.save()
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res['ETag'], etag)
+
+    def test_retrieve_with_etag_of_other_users_event(self):
+        event = sample_event(moderator=self.user2)
+        url = make_detail_event_url(event.id)
+
+        res = self.client.get(url, HTTP_IF_NONE_MATCH='*')
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_retrieve_event_of_other_users(self):
+        event = sample_event(moderator=self.user2)
+
+        res = self.client.get(make_detail_event_url(event.id))
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
     def test_create_event(self):
         data = {
             "title": "This is title",
@@ -167,6 +263,44 @@ class PrivateTests(TestCase):
         self.assertEqual(len(attenders), 2)
         self.assertIn(self.user2, attenders)
 
+    def test_create_event_with_many_attenders(self):
+        users = get_user_model().objects.bulk_create(
+            get_user_model()(username=f"many-{i}") for i in range(40))
+        data = {
+            "title": "This is title",
+            "location": "At Cafe",
+            "attenders": [user.id for user in users]
+        }
+
+        # the attenders with one IN query, the insert of the event, the
+        # attenders already set, the bulk insert of the through rows and the
+        # attenders of the response
+        with self.assertNumQueries(5):
+            res = self.client.post(EVENT_URL, data=data, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Event.objects.get(pk=res.data['id'])
+                              .attenders.count(), 41)
+
+    def test_create_event_with_missing_attenders(self):
+        data = {
+            "title": "This is title",
+            "location": "At Cafe",
+            "attenders": [self.user2.id, 9998, 9999, 9998]
+        }
+
+        res = self.client.post(EVENT_URL, data=data, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data['attenders'], [
+            'Invalid pk "9998" - object does not exist.',
+            'Invalid pk "9999" - object does not exist.',
+        ])
+
+        data["attenders"] = [self.user2.id, "abc"]
+        res = self.client.post(EVENT_URL, data=data, format='json')
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_partial_update_event(self):
         event = sample_event(moderator=self.user1)
         data = {
@@ -205,10 +339,123 @@ class PrivateTests(TestCase):
         url = make_start_event_url(event.id)
         res = self.client.post(url)
         gifts = Gift.objects.filter(event=event)
+        event.refresh_from_db()
 
-        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(res.data['status'], StartJob.DONE)
+        self.assertEqual(res['Location'],
+                         "http://testserver" +
+                         make_start_job_url(res.data['id']))
+        self.assertTrue(event.is_start)
         self.assertEqual(len(gifts), len(event.attenders.all()))
 
+    def test_start_job_status(self):
+        event = sample_event_for_start(self.user1, self.user2)
+        res = self.client.post(make_start_event_url(event.id))
+
+        resp = self.client.get(make_start_job_url(res.data['id']))
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.data['status'], StartJob.DONE)
+        self.assertEqual(resp.data['total'], 2)
+        self.assertEqual(resp.data['processed'], 2)
+
+    def test_start_job_status_of_other_event(self):
+        event = sample_event(self.user2)
+        job = StartJob.objects.create(event=event)
+
+        resp = self.client.get(make_start_job_url(job.id))
+        self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
+
+    @override_settings(SECRETSANTA_START_ASYNC=True)
+    @patch('secretsanta.jobs.get_executor')
+    def test_start_event_is_queued(self, mock_executor):
+        event = sample_event_for_start(self.user1, self.user2)
+        url = make_start_event_url(event.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            res = self.client.post(url)
+        resp = self.client.post(url)
+        job = StartJob.objects.get(event=event)
+
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(res.data['status'], StartJob.PENDING)
+        self.assertEqual(resp.data['id'], job.id)
+        mock_executor.return_value.submit.assert_called_once()
+        self.assertFalse(Gift.objects.filter(event=event).exists())
+
+    def test_start_event_with_abandoned_job(self):
+        event = sample_event_for_start(self.user1, self.user2)
+        job = StartJob.objects.create(event=event, status=StartJob.RUNNING)
+        StartJob.objects.filter(pk=job.pk).update(
+            date_updated=timezone.now() - timedelta(hours=1))
+
+        res = self.client.post(make_start_event_url(event.id))
+        job.refresh_from_db()
+        event.refresh_from_db()
+
+        self.assertNotEqual(res.data['id'], job.id)
+        self.assertEqual(res.data['status'], StartJob.DONE)
+        self.assertEqual(job.status, StartJob.FAILED)
+        self.assertTrue(event.is_start)
+        self.assertEqual(Gift.objects.filter(event=event).count(), 2)
+
+    def test_abandoned_pending_job_never_runs(self):
+        event = sample_event_for_start(self.user1, self.user2)
+        job = StartJob.objects.create(event=event)
+        StartJob.objects.filter(pk=job.pk).update(
+            date_updated=timezone.now() - timedelta(hours=1))
+
+        res = self.client.post(make_start_event_url(event.id))
+        # The executor reaches the abandoned job only now.
+        run_start_job(job.id)
+        job.refresh_from_db()
+
+        self.assertEqual(res.data['status'], StartJob.DONE)
+        self.assertEqual(job.status, StartJob.FAILED)
+        self.assertEqual(job.message,
+                         "Abandoned, the process running it stopped.")
+        self.assertEqual(Gift.objects.filter(event=event).count(), 2)
+
+    def test_heartbeat_keeps_a_long_start_alive(self):
+        event = sample_event_for_start(self.user1, self.user2)
+        job = StartJob.objects.create(event=event, status=StartJob.RUNNING)
+        StartJob.objects.filter(pk=job.pk).update(
+            date_updated=timezone.now() - timedelta(hours=1))
+
+        heartbeat = jobs.Heartbeat(job.id)
+        heartbeat.progress(1)
+        heartbeat.beat()
+        res = self.client.post(make_start_event_url(event.id))
+        job.refresh_from_db()
+
+        self.assertEqual(job.processed, 1)
+        self.assertEqual(res.data['id'], job.id)
+        self.assertEqual(res.data['status'], StartJob.RUNNING)
+        self.assertFalse(Gift.objects.filter(event=event).exists())
+
+    def test_join_while_a_start_is_running(self):
+        event = sample_event_for_start(self.user1, self.user2)
+        job = StartJob.objects.create(event=event)
+        newcomer = get_user_model().objects.create_user(username="Majid")
+        calls = []
+
+        def match_event(event):
+            result = real_match_event(event)
+            if not calls:
+                join_event(event, newcomer)
+            calls.append(event)
+            return result
+
+        real_match_event = jobs.match_event
+        with patch('secretsanta.jobs.match_event', match_event):
+            run_start_job(job.id)
+        job.refresh_from_db()
+
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(job.status, StartJob.DONE)
+        self.assertEqual(job.total, 3)
+        self.assertEqual(Gift.objects.filter(event=event).count(), 3)
+
     def test_start_event_403(self):
         event = sample_event_for_start(self.user1, self.user2)
         url = make_start_event_url(event.id)
@@ -224,6 +471,18 @@ class PrivateTests(TestCase):
         resp = self.client.post(url)
         self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_duplicate_start_jobs_match_once(self):
+        event = sample_event_for_start(self.user1, self.user2)
+        first = StartJob.objects.create(event=event)
+        second = StartJob.objects.create(event=event)
+
+        run_start_job(first.id)
+        run_start_job(second.id)
+        second.refresh_from_db()
+
+        self.assertEqual(Gift.objects.filter(event=event).count(), 2)
+        self.assertEqual(second.status, StartJob.FAILED)
+
     def test_get_gift_for_started_event(self):
         event = start_event_help_func(self.user1, self.user2, self.client)
         url = make_get_event_gift_for_current_user_url(event.id)
@@ -240,6 +499,124 @@ class PrivateTests(TestCase):
         self.assertEqual(resp.status_code, status.HTTP_200_OK)
         self.assertEqual(resp.data, serializer.data)
 
+    def test_get_gift_for_compact_event(self):
+        event = sample_event_for_start(self.user1, self.user2)
+        event.pairing_mode = Event.COMPACT
+        event.save()
+        self.client.post(make_start_event_url(event.id))
+
+        resp = self.client.get(make_get_event_gift_for_current_user_url(
+            event.id))
+
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.data['giver'], self.user1.id)
+        self.assertEqual(resp.data['reciver'], self.user2.id)
+        self.assertEqual(resp.data['event'], event.id)
+        self.assertFalse(Gift.objects.filter(event=event).exists())
+
+    def test_get_gift_not_modified(self):
+        event = start_event_help_func(self.user1, self.user2, self.client)
+        url = make_get_event_gift_for_current_user_url(event.id)
+        first = self.client.get(url)
+
+        # only the event
+        with self.assertNumQueries(1):
+            res = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        res = self.client.get(url,
+                              HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.client.force_authenticate(user=self.user2)
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_my_gifts(self):
+        first = start_event_help_func(self.user1, self.user2, self.client)
+        compact = sample_event_for_start(self.user1, self.user2)
+        compact.pairing_mode = Event.COMPACT
+        compact.save()
+        self.client.post(make_start_event_url(compact.id))
+        sample_event_for_start(self.user1, self.user2)
+        other = sample_event_for_start(
+            self.user2, get_user_model().objects.create_user(username="Majid"))
+        Event.objects.filter(pk=other.pk).update(is_start=True)
+
+        # the page of started events, the gifts of all of them and the
+        # packed pairing of the compact one, which is then kept in memory
+        with self.assertNumQueries(3):
+            res = self.client.get(MY_GIFTS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        gifts = res.data['results']
+        self.assertEqual([gift['event'] for gift in gifts],
+                         [compact.id, first.id])
+        for gift in gifts:
+            self.assertEqual(gift['giver'], self.user1.id)
+            self.assertEqual(gift['reciver'], self.user2.id)
+
+    def test_get_gift_expanded(self):
+        event = start_event_help_func(self.user1, self.user2, self.client)
+        url = make_get_event_gift_for_current_user_url(event.id)
+
+        # the event and the gift joined with its reciver
+        with self.assertNumQueries(2):
+            res = self.client.get(url, {"expand": "reciver,event"})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['reciver_detail'],
+                         {"username": "Foureyed", "name": "Mehrad"})
+        self.assertEqual(res.data['event_detail']['title'], event.title)
+        self.assertNotIn('reciver_detail', self.client.get(url).data)
+
+        etag = res['ETag']
+        res = self.client.get(url, {"expand": "reciver,event"},
+                              HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.user2.name = "Mehrad M"
+        self.user2.save()
+        res = self.client.get(url, {"expand": "reciver,event"},
+                              HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['reciver_detail']['name'], "Mehrad M")
+
+    def test_get_gift_expand_unknown_relation(self):
+        event = start_event_help_func(self.user1, self.user2, self.client)
+        url = make_get_event_gift_for_current_user_url(event.id)
+
+        res = self.client.get(url, {"expand": "giver"})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_my_gifts_expanded(self):
+        start_event_help_func(self.user1, self.user2, self.client)
+        compact = sample_event_for_start(self.user1, self.user2)
+        compact.pairing_mode = Event.COMPACT
+        compact.save()
+        self.client.post(make_start_event_url(compact.id))
+
+        res = self.client.get(MY_GIFTS_URL, {"expand": "reciver"})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([gift['reciver_detail']['username']
+                          for gift in res.data['results']],
+                         ["Foureyed", "Foureyed"])
+
+    def test_my_gifts_not_modified(self):
+        event = start_event_help_func(self.user1, self.user2, self.client)
+        etag = self.client.get(MY_GIFTS_URL)['ETag']
+
+        # only the page of started events
+        with self.assertNumQueries(1):
+            res = self.client.get(MY_GIFTS_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        Event.objects.filter(pk=event.pk).update(is_start=False)
+        res = self.client.get(MY_GIFTS_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['results'], [])
+
     def test_get_gift_when_event_is_not_started(self):
         event = sample_event(self.user1)
         url = make_get_event_gift_for_current_user_url(event.id)
@@ -258,6 +635,254 @@ class PrivateTests(TestCase):
         self.assertEqual(resp.status_code, status.HTTP_200_OK)
         self.assertIn(self.user2.id, resp.json().get('attenders'))
 
+    def test_add_mutual_exclusion(self):
+        event = sample_event_for_start(self.user1, self.user2)
+        url = make_add_exclusion_url(event.id)
+        payload = {
+            "giver": self.user1.username,
+            "reciver": self.user2.username,
+            "mutual": True
+        }
+
+        resp = self.client.post(url, data=payload)
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Exclusion.objects.filter(event=event).count(), 2)
+
+    def test_add_exclusion_for_non_attender(self):
+        event = sample_event_for_start(self.user1, self.user2)
+        outsider = get_user_model().objects.create_user(username="Majid")
+        url = make_add_exclusion_url(event.id)
+        payload = {
+            "giver": self.user1.username,
+            "reciver": outsider.username,
+        }
+
+        resp = self.client.post(url, data=payload)
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('reciver', resp.data)
+        self.assertNotIn('giver', resp.data)
+        self.assertFalse(Exclusion.objects.filter(event=event).exists())
+
+    def test_start_event_with_infeasible_exclusions(self):
+        event = sample_event_for_start(self.user1, self.user2)
+        Exclusion.objects.create(event=event, giver=self.user1,
+                                 reciver=self.user2)
+
+        resp = self.client.post(make_start_event_url(event.id))
+        event.refresh_from_db()
+
+        self.assertEqual(resp.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(resp.data['status'], StartJob.FAILED)
+        self.assertFalse(event.is_start)
+        self.assertFalse(Gift.objects.filter(event=event).exists())
+
+    def test_add_attender_to_started_event(self):
+        event = start_event_help_func(self.user1, self.user2, self.client)
+        user3 = get_user_model().objects.create_user(username="Majid")
+        url = make_add_attender_url(event.id)
+
+        resp = self.client.post(url, data={"username": user3.username})
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+        Event.objects.filter(pk=event.id).update(allow_late_join=True)
+        resp = self.client.post(url, data={"username": user3.username})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertIn(user3.id, resp.json().get('attenders'))
+        self.assertTrue(Gift.objects.filter(event=event,
+                                            giver=user3).exists())
+        self.assertEqual(Gift.objects.filter(event=event).count(), 3)
+
+    def test_add_attenders_in_bulk(self):
+        event = sample_event(moderator=self.user1)
+        event.attenders.add(self.user2)
+        get_user_model().objects.bulk_create(
+            get_user_model()(username=f"bulk-{i}") for i in range(30))
+        usernames = [f"bulk-{i}" for i in range(30)]
+        payload = {"usernames": usernames + ["Foureyed", "nobody",
+                                             "bulk-0"]}
+
+        # Event lookup and lock, user and attender lookups, the insert and
+        # the date_updated save, plus the savepoint pair.
+        with self.assertNumQueries(8):
+            resp = self.client.post(make_add_attenders_url(event.id),
+                                    data=payload, format='json')
+
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        results = [entry['result'] for entry in resp.data['results']]
+        self.assertEqual(results, ["added"] * 30 + [
+            "already_attending", "not_found", "duplicate"])
+        self.assertEqual(event.attenders.count(), 32)
+
+    def test_add_attenders_from_csv(self):
+        event = sample_event(moderator=self.user1)
+        get_user_model().objects.create_user(username="Majid")
+        upload = SimpleUploadedFile(
+            "attenders.csv", b"username,team\nMajid,a\n\nFoureyed,b\n",
+            content_type="text/csv")
+
+        resp = self.client.post(make_add_attenders_url(event.id),
+                                data={"file": upload}, format='multipart')
+
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.data['results'], [
+            {"username": "Majid", "result": "added"},
+            {"username": "Foureyed", "result": "added"},
+        ])
+        self.assertTrue(event.attenders.filter(username="Majid").exists())
+
+    def test_add_attenders_from_invalid_file(self):
+        event = sample_event(moderator=self.user1)
+        get_user_model().objects.create_user(username="Majid")
+        upload = SimpleUploadedFile(
+            "attenders.csv", b"username\nMajid\n\xff\xfeMina\n",
+            content_type="text/csv")
+
+        resp = self.client.post(make_add_attenders_url(event.id),
+                                data={"file": upload}, format='multipart')
+
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('file', resp.data)
+        self.assertFalse(event.attenders.filter(username="Majid").exists())
+
+    def test_add_attenders_to_started_event(self):
+        event = start_event_help_func(self.user1, self.user2, self.client)
+        get_user_model().objects.create_user(username="Majid")
+        get_user_model().objects.create_user(username="Mina")
+        url = make_add_attenders_url(event.id)
+        payload = {"usernames": ["Majid", "Mina"]}
+
+        resp = self.client.post(url, data=payload, format='json')
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+        Event.objects.filter(pk=event.id).update(allow_late_join=True)
+        resp = self.client.post(url, data=payload, format='json')
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(Gift.objects.filter(event=event).count(), 4)
+        self.assertEqual(
+            set(Gift.objects.filter(event=event)
+                            .values_list('reciver__username', flat=True)),
+            {"ATPJ", "Foureyed", "Majid", "Mina"})
+
+    def test_add_many_attenders_to_started_event(self):
+        event = start_event_help_func(self.user1, self.user2, self.client)
+        Event.objects.filter(pk=event.id).update(allow_late_join=True)
+        users = get_user_model().objects.bulk_create(
+            get_user_model()(username=f"user-{i}") for i in range(40))
+        url = make_add_attenders_url(event.id)
+
+        # The event, its locked row, the users, the attenders among them,
+        # the through rows, the exclusions, the sampled gifts (three queries
+        # when there are fewer than asked), their bulk update and bulk
+        # insert and the date_updated save, plus the savepoint pair; the
+        # same for any number of newcomers.
+        with self.assertNumQueries(14):
+            resp = self.client.post(
+                url, data={"usernames": [user.username for user in users]},
+                format='json')
+
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        pairs = dict(Gift.objects.filter(event=event)
+                                 .values_list('giver_id', 'reciver_id'))
+        attenders = set(event.attenders.values_list('pk', flat=True))
+        self.assertEqual(len(attenders), 42)
+        self.assertEqual(set(pairs), attenders)
+        self.assertEqual(set(pairs.values()), attenders)
+        giver, seen = self.user1.pk, set()
+        while giver not in seen:
+            seen.add(giver)
+            giver = pairs[giver]
+        self.assertEqual(len(seen), 42)
+
+    def test_add_attenders_needs_usernames_or_file(self):
+        event = sample_event(moderator=self.user1)
+
+        resp = self.client.post(make_add_attenders_url(event.id),
+                                data={}, format='json')
+
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_remove_attender(self):
+        event = sample_event_for_start(self.user1, self.user2)
+        url = reverse("santa:event-remove-attender", args=(event.id, ))
+
+        resp = self.client.post(url, data={"username": self.user2.username})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertNotIn(self.user2, event.attenders.all())
+
+        resp = self.client.post(url, data={"username": self.user1.username})
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@skipUnless(connection.features.has_select_for_update,
+            "Needs a database with row locks.")
+@override_settings(SECRETSANTA_START_ASYNC=False)
+class ConcurrentStartTests(TransactionTestCase):
+
+    def setUp(self) -> None:
+        self.moderator = get_user_model().objects.create_user(
+            username="ATPJ",
+            password="atpj1234",
+            name="Amirali"
+        )
+        self.event = sample_event(self.moderator)
+        self.event.attenders.add(*(
+            get_user_model().objects.create_user(username=f"user-{i}")
+            for i in range(20)
+        ))
+
+    def start(self, _):
+        client = APIClient()
+        client.force_authenticate(user=self.moderator)
+        try:
+            return client.post(make_start_event_url(self.event.id))
+        finally:
+            connections.close_all()
+
+    def test_parallel_starts_write_one_matching(self):
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            responses = list(executor.map(self.start, range(16)))
+
+        codes = {res.status_code for res in responses}
+        self.assertLessEqual(codes, {status.HTTP_202_ACCEPTED,
+                                     status.HTTP_400_BAD_REQUEST})
+        self.assertEqual(StartJob.objects.filter(event=self.event).count(), 1)
+        self.assertEqual(Gift.objects.filter(event=self.event).count(), 21)
+
+    def test_start_while_a_start_is_running(self):
+        job = StartJob.objects.create(event=self.event)
+        writing, release = threading.Event(), threading.Event()
+
+        def create_gifts(*args, **kwargs):
+            # The Gift rows are inserted, the transaction is still open.
+            created = real_create_gifts(*args, **kwargs)
+            writing.set()
+            release.wait(30)
+            return created
+
+        def run(_):
+            try:
+                run_start_job(job.id)
+            finally:
+                connections.close_all()
+
+        real_create_gifts = utils.create_gifts
+        with patch('secretsanta.utils.create_gifts', create_gifts), \
+                ThreadPoolExecutor(max_workers=2) as executor:
+            running = executor.submit(run, None)
+            self.assertTrue(writing.wait(30))
+            try:
+                res = executor.submit(self.start, None).result(timeout=10)
+            finally:
+                release.set()
+            running.result(timeout=30)
+
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(res.data['id'], job.id)
+        self.assertEqual(res.data['status'], StartJob.RUNNING)
+        job.refresh_from_db()
+        self.assertEqual(job.status, StartJob.DONE)
+        self.assertEqual(Gift.objects.filter(event=self.event).count(), 21)
+
 
 class ImageUploadTests(TestCase):
     """Tests for the image upload API."""
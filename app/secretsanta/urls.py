@@ -6,6 +6,7 @@ from secretsanta import views
 
 router = DefaultRouter()
 router.register("event", views.EventViewSet)
+router.register("start-job", views.StartJobViewSet, basename="start-job")
 
 
 urlpatterns = [
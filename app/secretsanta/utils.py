@@ -1,23 +1,256 @@
 import os
-import random
 import time
+from array import array
+from itertools import islice
 
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from core.metrics import Counter, Histogram
 from core.models import Event, Gift
 
+from secretsanta.matching import MatchingInfeasible, match_in_groups
+from secretsanta.pairing import PackedPairing, pack_pairing
+
+
+GIFT_BATCH_SIZE = 1000
+DEFAULT_MATCHER = 'secretsanta.matching.ExclusionMatcher'
+PARALLEL_THRESHOLD = 50000
+SPLIT_ATTEMPTS = 10
+
+MATCHING_SECONDS = Histogram(
+    'secretsanta_matching_duration_seconds',
+    "Time spent matching the attenders of started events.",
+    ['pairing_mode'], buckets=(.01, .05, .1, .5, 1, 5, 10, 30, 60, 300))
+GIFTS_CREATED = Counter(
+    'secretsanta_gifts_created_total',
+    "Gifts assigned by started events.", ['pairing_mode'])
+
+
+def get_matcher(seed=None):
+    """Instantiate the matcher configured by SECRETSANTA_MATCHER."""
+    if seed is None:
+        seed = int(time.time()) + int.from_bytes(os.urandom(4))
+    path = getattr(settings, 'SECRETSANTA_MATCHER', DEFAULT_MATCHER)
+    return import_string(path)(seed)
+
+
+def load_attender_ids(event: Event) -> array:
+    """Stream the attender primary keys of event into a compact array."""
+    ids = array('q')
+    queryset = event.attenders.values_list('pk', flat=True)
+    ids.extend(queryset.iterator(chunk_size=GIFT_BATCH_SIZE))
+    return ids
+
+
+def load_exclusions(event: Event):
+    """Return the (giver, reciver) pairs which are excluded in event."""
+    return event.exclusions.values_list('giver_id', 'reciver_id')
+
+
+def linked_event_ids(event: Event, depth: int):
+    """Return the ids of up to depth events linked before event."""
+    ids = []
+    previous = event.previous_event_id
+    while previous is not None and previous not in ids and len(ids) < depth:
+        ids.append(previous)
+        previous = Event.objects.filter(pk=previous)\
+                                .values_list('previous_event_id', flat=True)\
+                                .first()
+    return ids
+
+
+def load_pair_history(event: Event):
+    """Return the set of (giver, reciver) pairs of the linked events.
+
+    The index is built with a single query over the Gift table (and one for
+    the packed pairings of compact events), so matching can look pairs up in
+    O(1) instead of querying per candidate.
+    """
+    event_ids = linked_event_ids(event, event.history_depth)
+    if not event_ids:
+        return set()
+    history = set(Gift.objects.filter(event_id__in=event_ids)
+                              .values_list('giver_id', 'reciver_id'))
+    blobs = Event.objects.filter(pk__in=event_ids,
+                                 pairing_mode=Event.COMPACT)\
+                         .exclude(pairing=None)\
+                         .values_list('pairing', flat=True)
+    for blob in blobs:
+        history.update(PackedPairing(blob))
+    return history
+
+
+def create_gifts(event: Event, pairs, batch_size: int = GIFT_BATCH_SIZE,
+                 progress=None):
+    """Insert Gift rows for pairs in batches of batch_size.
+
+    progress is called with the number of rows created after every batch.
+    """
+    pairs = iter(pairs)
+    created = 0
+    while True:
+        batch = [
+            Gift(giver_id=giver, reciver_id=reciver, event_id=event.pk)
+            for giver, reciver in islice(pairs, batch_size)
+        ]
+        if not batch:
+            return created
+        Gift.objects.bulk_create(batch)
+        created += len(batch)
+        if progress is not None:
+            progress(created)
+
+
+def split_into_groups(attender_ids, group_size: int, rng) -> list:
+    """Shuffle attender_ids into groups of group_size.
+
+    A last group of a single attender is merged into the previous one, so
+    nobody ends up buying a gift for themselves.
+    """
+    attender_ids = array('q', attender_ids)
+    rng.shuffle(attender_ids)
+    groups = [attender_ids[i:i + group_size]
+              for i in range(0, len(attender_ids), group_size)]
+    if len(groups) > 1 and len(groups[-1]) < 2:
+        groups[-2].extend(groups.pop())
+    return groups
+
 
-def match_and_create_gift_for_attenders(event: Event):
-    seed = int(time.time()) + int.from_bytes(os.urandom(4))
-    random.seed(seed)
-    attenders = list(event.attenders.all())
-    random.shuffle(attenders)
+def match_attenders(matcher, attender_ids, exclusions, groups=None):
+    """Run matcher over all attenders, or over every group independently.
 
-    for i in range(len(attenders)):
-        if i == len(attenders) - 1:
-            giver = attenders[i]
-            reciver = attenders[0]
+    Large grouped events are matched in a process pool of
+    SECRETSANTA_MATCH_WORKERS processes.
+    """
+    if not groups or len(groups) < 2:
+        return matcher.match(attender_ids, exclusions)
+
+    max_workers = 1
+    threshold = getattr(settings, 'SECRETSANTA_PARALLEL_THRESHOLD',
+                        PARALLEL_THRESHOLD)
+    if len(attender_ids) >= threshold:
+        max_workers = getattr(settings, 'SECRETSANTA_MATCH_WORKERS', None) \
+            or os.cpu_count()
+    return match_in_groups(type(matcher), matcher.seed, groups, exclusions,
+                           max_workers=max_workers)
+
+
+def match_in_random_groups(matcher, attender_ids, exclusions,
+                           group_size: int):
+    """Match attenders in random groups of group_size.
+
+    A split can trap excluded pairs in one group, so an infeasible split is
+    reshuffled up to SPLIT_ATTEMPTS times before all attenders are matched
+    together instead.
+    """
+    for _ in range(SPLIT_ATTEMPTS):
+        groups = split_into_groups(attender_ids, group_size, matcher.rng)
+        try:
+            return match_attenders(matcher, attender_ids, exclusions, groups)
+        except MatchingInfeasible:
+            continue
+    return match_attenders(matcher, attender_ids, exclusions)
+
+
+def store_compact_pairing(event: Event, givers, recivers, seed=None):
+    """Save the whole matching of a compact event into its own row."""
+    event.pairing = pack_pairing(givers, recivers)
+    event.pairing_seed = seed
+    event.save(update_fields=['pairing', 'pairing_seed', 'date_updated'])
+    return len(givers)
+
+
+def match_event(event: Event, matcher=None):
+    """Match the attenders of event, returning (givers, recivers, seed).
+
+    Attenders are matched in independent random groups when
+    event.group_size is set. If no random split can be matched, the groups
+    are dropped.
+
+    Pairs from the last event.history_depth linked events are avoided when
+    possible, if they make matching infeasible only the exclusion rules are
+    kept. Raises MatchingInfeasible when the exclusion rules can not be
+    satisfied.
+    """
+    if matcher is None:
+        matcher = get_matcher()
+    attender_ids = load_attender_ids(event)
+    exclusions = list(load_exclusions(event))
+    history = load_pair_history(event)
+
+    def match(rules):
+        if event.group_size:
+            return match_in_random_groups(matcher, attender_ids, rules,
+                                          event.group_size)
+        return match_attenders(matcher, attender_ids, rules)
+
+    began = time.perf_counter()
+    try:
+        givers, recivers = match(history.union(exclusions))
+    except MatchingInfeasible:
+        if not history:
+            raise
+        givers, recivers = match(exclusions)
+    MATCHING_SECONDS.observe(time.perf_counter() - began,
+                             pairing_mode=event.pairing_mode)
+    return givers, recivers, getattr(matcher, 'seed', None)
+
+
+def store_matching(event: Event, givers, recivers, seed=None,
+                   batch_size: int = GIFT_BATCH_SIZE, progress=None,
+                   start: bool = False) -> bool:
+    """Write a matching of event as Gift rows, or packed into the event.
+
+    With start the event is marked started in the same transaction, but
+    only if it is neither started nor updated since event was loaded;
+    otherwise nothing is written and False is returned. The event row is
+    not locked while the Gift rows are written.
+    """
+    with transaction.atomic():
+        fields = {}
+        if event.pairing_mode == Event.COMPACT:
+            if start:
+                fields['pairing'] = pack_pairing(givers, recivers)
+                fields['pairing_seed'] = seed
+            else:
+                store_compact_pairing(event, givers, recivers, seed)
+            if progress is not None:
+                progress(len(givers))
         else:
-            giver = attenders[i]
-            reciver = attenders[i+1]
-        Gift.objects.create(giver=giver, reciver=reciver, event=event)
+            create_gifts(event, zip(givers, recivers), batch_size, progress)
 
+        if start and not Event.objects.filter(
+                pk=event.pk, is_start=False,
+                date_updated=event.date_updated,
+        ).update(is_start=True, date_updated=timezone.now(), **fields):
+            transaction.set_rollback(True)
+            return False
+    GIFTS_CREATED.inc(len(givers), pairing_mode=event.pairing_mode)
     return True
+
+
+def match_and_create_gift_for_attenders(event: Event,
+                                        batch_size: int = GIFT_BATCH_SIZE,
+                                        matcher=None,
+                                        progress=None):
+    """Match the attenders of event and store the result.
+
+    See match_event and store_matching.
+    """
+    givers, recivers, seed = match_event(event, matcher)
+    store_matching(event, givers, recivers, seed, batch_size, progress)
+    return True
+
+
+def locked_events():
+    """Return the events, locking the selected rows until the commit.
+
+    Where the database supports it the rows are locked FOR NO KEY UPDATE,
+    which unlike FOR UPDATE does not wait for transactions inserting rows
+    referencing the event, like the Gift rows of a start.
+    """
+    return Event.objects.select_for_update(
+        no_key=connection.features.has_select_for_no_key_update)
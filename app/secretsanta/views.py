@@ -1,23 +1,35 @@
+from itertools import chain, islice
+from types import SimpleNamespace
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Prefetch, Value
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 
-from rest_framework import viewsets, status
+from rest_framework import viewsets, mixins, status
 from rest_framework import permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.exceptions import (server_error, bad_request,
-                                       ValidationError)
-
-from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework.reverse import reverse
+from rest_framework.exceptions import bad_request, ValidationError
+from rest_framework.renderers import JSONRenderer
 
-from drf_spectacular.utils import extend_schema
+from drf_spectacular.utils import OpenApiParameter, extend_schema
 
-from core.models import Event, Gift
+from core.authentication import JWTAuthentication
+from core.models import Event, Gift, Exclusion, StartJob
+from core.renderers import stream_json_object
+from core.timing import TimedAPIViewMixin, timed
 
 from secretsanta.serializers import (
     EventSerializer,
     GiftSerializer,
+    StartJobSerializer,
     AddAttenderSerializer,
+    AddAttendersSerializer,
+    AddExclusionSerializer,
     EventImageSerializer
 )
 from secretsanta.permissions import (
@@ -26,20 +38,54 @@ from secretsanta.permissions import (
     IsEventAttender
 )
 
-from secretsanta.utils import match_and_create_gift_for_attenders
+from secretsanta.conditional import (
+    event_etag,
+    gift_etag,
+    gift_list_etag,
+    has_preconditions,
+    not_modified,
+    set_validators,
+    with_profiles
+)
+from secretsanta.fast import (
+    attach_attenders,
+    event_data,
+    event_rows,
+    gift_data,
+    iter_attenders
+)
+from secretsanta.jobs import enqueue_event_start
+from secretsanta.pagination import EventCursorPagination
+from secretsanta.matching import MatchingInfeasible
+from secretsanta.pairing import get_pairing
+from secretsanta.splice import join_event, join_event_in_bulk, leave_event
 
 
-class EventViewSet(viewsets.ModelViewSet):
+STREAM_ATTENDERS = 10000
+
+
+class EventViewSet(TimedAPIViewMixin, viewsets.ModelViewSet):
 
     serializer_class = EventSerializer
     queryset = Event.objects.all()
     authentication_classes = [JWTAuthentication, ]
     permission_classes = [permissions.IsAuthenticated, EventPermission]
+    pagination_class = EventCursorPagination
 
     def get_queryset(self):
         """ Return events which the authenticated user is in attenders list"""
-        return self.queryset.filter(attenders=self.request.user)\
-                            .order_by('-date_created')
+        queryset = self.queryset.filter(attenders=self.request.user.pk)\
+                                .annotate(viewer_is_attender=Value(True))\
+                                .defer('pairing')\
+                                .order_by('-date_created', '-id')
+        if self.action in ['list', 'retrieve']:
+            # One query for the attender ids of every event on the page,
+            # the moderator is serialized from its foreign key column.
+            queryset = queryset.prefetch_related(Prefetch(
+                'attenders',
+                queryset=get_user_model().objects.only('pk').order_by('pk')
+            ))
+        return queryset
 
     def get_serializer_class(self):
         if self.action == "upload_image":
@@ -47,26 +93,119 @@ class EventViewSet(viewsets.ModelViewSet):
 
         return self.serializer_class
 
+    def use_fast_serializers(self) -> bool:
+        """Whether to answer from database rows instead of serializers"""
+        return self.request.method in permissions.SAFE_METHODS and \
+            getattr(settings, 'SECRETSANTA_FAST_SERIALIZERS', True)
+
+    def get_event_row(self) -> dict:
+        """Like get_object, but return the event as a values() row"""
+        lookup = self.kwargs[self.lookup_url_kwarg or self.lookup_field]
+        try:
+            row = event_rows(self.filter_queryset(self.get_queryset()))\
+                .filter(pk=lookup).first()
+        except (TypeError, ValueError, DjangoValidationError):
+            row = None
+        if row is None:
+            raise Http404
+        # The queryset only holds attended events.
+        self.check_object_permissions(self.request, SimpleNamespace(
+            pk=row['id'], moderator_id=row['moderator_id'],
+            viewer_is_attender=True))
+        return row
+
+    def event_row_response(self, row: dict):
+        """Respond with an event row, streaming a very large attender list
+
+        Up to SECRETSANTA_STREAM_ATTENDERS attenders the response is built
+        as usual. Beyond that, and only for compact JSON, the attender ids
+        are written while they are read from the database.
+        """
+        threshold = getattr(settings, 'SECRETSANTA_STREAM_ATTENDERS',
+                            STREAM_ATTENDERS)
+        attenders = iter_attenders(row['id'])
+        row['attenders'] = list(islice(attenders, threshold + 1))
+        renderer = self.request.accepted_renderer
+        if len(row['attenders']) <= threshold or \
+                not isinstance(renderer, JSONRenderer) or \
+                renderer.get_indent(self.request.accepted_media_type, {}):
+            row['attenders'].extend(attenders)
+            with timed('serialize'):
+                return Response(event_data(row, self.request))
+
+        row['attenders'] = chain(row['attenders'], attenders)
+        return StreamingHttpResponse(
+            stream_json_object(renderer, event_data(row, self.request),
+                               'attenders'),
+            content_type=renderer.media_type)
+
+    def list(self, request, *args, **kwargs):
+        if not self.use_fast_serializers():
+            return super().list(request, *args, **kwargs)
+        rows = self.paginate_queryset(
+            event_rows(self.filter_queryset(self.get_queryset())))
+        attach_attenders(rows)
+        with timed('serialize'):
+            data = [event_data(row, request) for row in rows]
+        return self.get_paginated_response(data)
+
+    def retrieve(self, request, *args, **kwargs):
+        """Return the event, or 304 when the client copy is still current"""
+        if self.use_fast_serializers():
+            row = self.get_event_row()
+            etag = event_etag(row['id'], row['date_updated'])
+            response = not_modified(request, etag, row['date_updated'])
+            if response is None:
+                response = self.event_row_response(row)
+            return set_validators(response, etag, row['date_updated'])
+
+        if has_preconditions(request):
+            # The queryset is limited to attended events, which is all the
+            # object permission checks for retrieve.
+            try:
+                date_updated = self.get_queryset().prefetch_related(None)\
+                                   .filter(pk=kwargs['pk'])\
+                                   .values_list('date_updated', flat=True)\
+                                   .first()
+            except (TypeError, ValueError, DjangoValidationError):
+                date_updated = None
+            if date_updated is not None:
+                etag = event_etag(kwargs['pk'], date_updated)
+                response = not_modified(request, etag, date_updated)
+                if response is not None:
+                    return set_validators(response, etag, date_updated)
+
+        event = self.get_object()
+        with timed('serialize'):
+            response = Response(self.get_serializer(event).data)
+        return set_validators(response, event_etag(event.pk,
+                                                   event.date_updated),
+                              event.date_updated)
+
     def perform_create(self, serializer: serializer_class):
         current_user = self.request.user
         serializer.validated_data['moderator'] = current_user
         serializer.validated_data['attenders'].append(current_user)
         serializer.save()
 
+    @extend_schema(request=None, responses={202: StartJobSerializer})
     @action(detail=True, methods=['POST'], url_path="start",
             url_name="start",
             permission_classes=[permissions.IsAuthenticated, IsEventModerator])
     def event_start(self, request, pk=None):
+        """Queue matching the attenders and return the start job"""
         event = self.get_object()
-        if event.is_start:
+        job = enqueue_event_start(event)
+        if job is None:
             return bad_request(request, ValidationError)
-        state = match_and_create_gift_for_attenders(event)
-        if not state:
-            return server_error(request)
-        event.is_start = True
-        event.save()
-        return Response({"Message": "ok"}, 200)
+        location = reverse("santa:start-job-detail", args=(job.pk, ),
+                           request=request)
+        return Response(StartJobSerializer(job).data,
+                        status.HTTP_202_ACCEPTED,
+                        headers={"Location": location})
 
+    @extend_schema(parameters=[OpenApiParameter(
+        'expand', str, description="Comma separated: reciver, event")])
     @action(detail=True, methods=['GET'], url_path="gift",
             url_name="gift", serializer_class=GiftSerializer,
             permission_classes=[permissions.IsAuthenticated, IsEventAttender])
@@ -74,10 +213,112 @@ class EventViewSet(viewsets.ModelViewSet):
         event = self.get_object()
         if not event.is_start:
             return bad_request(request, ValidationError())
-        gift = Gift.objects.get(event=event, giver=request.user)
-        serialized_data = self.get_serializer(gift).data
+        expand = self.get_gift_expand()
+        etag = gift_etag(event.pk, event.date_updated, request.user.pk)
+        if 'reciver' not in expand:
+            response = not_modified(request, etag, event.date_updated)
+            if response is not None:
+                return set_validators(response, etag, event.date_updated)
+
+        gifts = self.load_gifts([event], expand)
+        if not gifts:
+            raise Http404
+        last_modified = event.date_updated
+        if 'reciver' in expand:
+            etag, last_modified = with_profiles(etag, [gifts[0].reciver]), None
+            response = not_modified(request, etag)
+            if response is not None:
+                return set_validators(response, etag)
+        serialized_data = self.serialize_gifts(gifts, expand)[0]
+
+        return set_validators(Response(serialized_data), etag, last_modified)
+
+    @extend_schema(responses=GiftSerializer(many=True),
+                   parameters=[OpenApiParameter(
+                       'expand', str,
+                       description="Comma separated: reciver, event")])
+    @action(detail=False, methods=['GET'], url_path="my-gifts",
+            url_name="my-gifts", serializer_class=GiftSerializer)
+    def my_gifts(self, request):
+        """Return the gift of the user in every started event, paginated
+
+        The page is cut from the started events, then the Gift rows of all
+        of them are read with a single query; compact events answer from
+        their packed pairing.
+        """
+        events = self.paginate_queryset(
+            self.get_queryset().filter(is_start=True))
+        expand = self.get_gift_expand()
+        etag = gift_list_etag(request, events, self.paginator.has_next)
+        if 'reciver' not in expand:
+            response = not_modified(request, etag)
+            if response is not None:
+                return set_validators(response, etag)
+
+        gifts = self.load_gifts(events, expand)
+        if 'reciver' in expand:
+            etag = with_profiles(etag, [gift.reciver for gift in gifts])
+            response = not_modified(request, etag)
+            if response is not None:
+                return set_validators(response, etag)
+        response = self.get_paginated_response(
+            self.serialize_gifts(gifts, expand))
+        return set_validators(response, etag)
+
+    def get_gift_expand(self) -> tuple:
+        """Return the relations named in the expand query parameter"""
+        expand = tuple(name for name in
+                       self.request.query_params.get('expand', '').split(',')
+                       if name)
+        unknown = set(expand) - set(GiftSerializer.EXPANDABLE)
+        if unknown:
+            raise ValidationError(
+                {"expand": f"Can not expand {', '.join(sorted(unknown))}."})
+        return expand
+
+    def serialize_gifts(self, gifts, expand=()) -> list:
+        with timed('serialize'):
+            if self.use_fast_serializers():
+                return [gift_data(gift, self.request, expand)
+                        for gift in gifts]
+            return self.get_serializer(gifts, many=True, expand=expand).data
+
+    def load_gifts(self, events, expand=()) -> list:
+        """Return the gifts of the user in events, in the same order
+
+        Gift rows of every event are read with one query, joined with the
+        reciver when it is expanded; compact events answer from their packed
+        pairing and load the expanded recivers with one more query. Events
+        are attached from the given instances, which are already loaded.
+        """
+        user = self.request.user
+        rows = Gift.objects.filter(
+            giver_id=user.pk,
+            event__in=[event for event in events
+                       if event.pairing_mode != Event.COMPACT])
+        if 'reciver' in expand:
+            rows = rows.select_related('reciver')
+        rows = {gift.event_id: gift for gift in rows}
+
+        gifts = []
+        for event in events:
+            if event.pairing_mode == Event.COMPACT:
+                reciver = get_pairing(event).reciver_of(user.pk)
+                gift = None if reciver is None else \
+                    Gift(event=event, giver_id=user.pk, reciver_id=reciver)
+            else:
+                gift = rows.get(event.pk)
+            if gift is not None:
+                gift.event = event
+                gifts.append(gift)
 
-        return Response(serialized_data)
+        packed = [gift for gift in gifts if gift.pk is None]
+        if 'reciver' in expand and packed:
+            recivers = get_user_model().objects.in_bulk(
+                [gift.reciver_id for gift in packed])
+            for gift in packed:
+                gift.reciver = recivers[gift.reciver_id]
+        return gifts
 
     @extend_schema(request=AddAttenderSerializer)
     @action(detail=True, methods=['POST'], url_path='add-attender',
@@ -85,7 +326,7 @@ class EventViewSet(viewsets.ModelViewSet):
             permission_classes=[permissions.IsAuthenticated, IsEventModerator])
     def add_attender(self, request, pk=None):
         event = self.get_object()
-        if event.is_start:
+        if event.is_start and not event.allow_late_join:
             return bad_request(request, ValidationError)
 
         serializer = AddAttenderSerializer(data=request.data)
@@ -94,11 +335,91 @@ class EventViewSet(viewsets.ModelViewSet):
                 get_user_model(),
                 username=serializer.validated_data.get('username')
             )
-            event.attenders.add(new_attender)
-            event.save()
+            try:
+                join_event(event, new_attender)
+            except MatchingInfeasible as exc:
+                return Response({"Message": str(exc)},
+                                status.HTTP_400_BAD_REQUEST)
         serialize = self.get_serializer(event)
         return Response(serialize.data)
 
+    @extend_schema(request=AddAttendersSerializer)
+    @action(detail=True, methods=['POST'], url_path='add-attenders',
+            url_name='add-attenders',
+            permission_classes=[permissions.IsAuthenticated, IsEventModerator])
+    def add_attenders(self, request, pk=None):
+        """Add many attenders at once and report the result for each name"""
+        event = self.get_object()
+        if event.is_start and not event.allow_late_join:
+            return bad_request(request, ValidationError)
+
+        serializer = AddAttendersSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        report = join_event_in_bulk(event, serializer.get_usernames())
+        return Response({"results": report})
+
+    @extend_schema(request=AddAttenderSerializer)
+    @action(detail=True, methods=['POST'], url_path='remove-attender',
+            url_name='remove-attender',
+            permission_classes=[permissions.IsAuthenticated, IsEventModerator])
+    def remove_attender(self, request, pk=None):
+        """Remove an attender, closing its gap if the event is started"""
+        event = self.get_object()
+        if event.is_start and not event.allow_late_join:
+            return bad_request(request, ValidationError)
+
+        serializer = AddAttenderSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        attender = get_object_or_404(
+            get_user_model(),
+            username=serializer.validated_data.get('username')
+        )
+        if attender == event.moderator:
+            return bad_request(request, ValidationError)
+        try:
+            leave_event(event, attender)
+        except MatchingInfeasible as exc:
+            return Response({"Message": str(exc)},
+                            status.HTTP_400_BAD_REQUEST)
+        return Response(self.get_serializer(event).data)
+
+    @extend_schema(request=AddExclusionSerializer)
+    @action(detail=True, methods=['POST'], url_path='add-exclusion',
+            url_name='add-exclusion',
+            permission_classes=[permissions.IsAuthenticated, IsEventModerator])
+    def add_exclusion(self, request, pk=None):
+        """Forbid the giver from buying a gift for the reciver"""
+        event = self.get_object()
+        if event.is_start:
+            return bad_request(request, ValidationError)
+
+        serializer = AddExclusionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        giver = get_object_or_404(
+            get_user_model(),
+            username=serializer.validated_data.get('giver')
+        )
+        reciver = get_object_or_404(
+            get_user_model(),
+            username=serializer.validated_data.get('reciver')
+        )
+        attending = set(event.attenders.filter(pk__in=[giver.pk, reciver.pk])
+                                       .values_list('pk', flat=True))
+        errors = {field: "This user does not attend the event."
+                  for field, user in (('giver', giver), ('reciver', reciver))
+                  if user.pk not in attending}
+        if errors:
+            raise ValidationError(errors)
+        pairs = [(giver, reciver)]
+        if serializer.validated_data.get('mutual'):
+            pairs.append((reciver, giver))
+        for exclusion_giver, exclusion_reciver in pairs:
+            Exclusion.objects.get_or_create(event=event,
+                                            giver=exclusion_giver,
+                                            reciver=exclusion_reciver)
+
+        return Response(serializer.data, status.HTTP_201_CREATED)
+
     @extend_schema(request=EventImageSerializer)
     @action(methods=['POST'], detail=True, url_path='upload-image')
     def upload_image(self, request, pk=None):
@@ -111,3 +432,18 @@ class EventViewSet(viewsets.ModelViewSet):
             return Response(serializer.data, status=status.HTTP_200_OK)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class StartJobViewSet(TimedAPIViewMixin, mixins.RetrieveModelMixin,
+                      viewsets.GenericViewSet):
+    """Report the status and progress of event start jobs"""
+
+    serializer_class = StartJobSerializer
+    queryset = StartJob.objects.all()
+    authentication_classes = [JWTAuthentication, ]
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        """ Return jobs of events which the authenticated user attends"""
+        return self.queryset.filter(
+            event__attenders=self.request.user.pk)